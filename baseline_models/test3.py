@@ -8,6 +8,8 @@ from sklearn.metrics import classification_report, confusion_matrix, ConfusionMa
 import matplotlib.pyplot as plt
 from sklearn.tree._tree import Tree
 
+from data_formatting.survey_matrix import build_survey_matrix
+
 # Step 1: Load data
 df = pd.read_excel("Mapped_Result.xlsx")
 print("✅ File loaded successfully.")
@@ -81,7 +83,8 @@ print("✅ All NaN values replaced with 0.")
 
 
 # Step 6: Prepare features and target
-X = df[all_features].select_dtypes(include="number")
+features, feature_names = build_survey_matrix(df[all_features])
+X = pd.DataFrame(features, columns=feature_names, index=df.index)
 y = df["target"]
 
 # Step 7: Train-test split
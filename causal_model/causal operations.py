@@ -1,4 +1,6 @@
+import hashlib
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 import networkx as nx
 import numpy as np
@@ -8,15 +10,128 @@ from causallearn.search.ConstraintBased.FCI import fci
 # from independence_tests_with_fallback import fci
 from causallearn.utils.GraphUtils import GraphUtils
 from dowhy import gcm
-from numpy.distutils.misc_util import is_string
 from pandas import DataFrame
+from scipy.special import chdtrc, stdtr
+from statsmodels.stats.multitest import multipletests
 
+from data_formatting.survey_matrix import build_survey_matrix, integer_codes
 
-def causal_search_space_reduction(questions: DataFrame, vos: str, output_file:str):
+SCREENING_METHODS = ("chisq", "gsq", "correlation", "kernel")
+ASSESSMENT_METHODS = ("kernel", "partial_correlation")
+
+
+def contingency_screening(matrix: np.ndarray, target: np.ndarray, G_sq: bool = False):
+    """
+    Chi-square (or G-square, i.e. mutual information) test of every column of the matrix against the target,
+    with the contingency tables of all columns counted in one np.bincount.
+    :param matrix: The answers, shape (samples, columns).
+    :param target: The answers of the variable of significance, shape (samples,).
+    :param G_sq: Use the G-square statistic (2 * samples * mutual information) instead of the chi-square statistic.
+    :return: The p-value of every column.
+    """
+    codes, cardinalities = integer_codes(matrix)
+    target_values, target_codes = np.unique(target, return_inverse=True)
+    n_columns, max_card, card_target = matrix.shape[1], int(cardinalities.max()), len(target_values)
+
+    index = (np.arange(n_columns)[None, :] * max_card + codes) * card_target + target_codes[:, None]
+    counts = np.bincount(index.ravel(), minlength=n_columns * max_card * card_target)
+    counts = counts.reshape(n_columns, max_card, card_target).astype(float)
+
+    row_counts = counts.sum(axis=2)
+    column_counts = counts.sum(axis=1)
+    expected = row_counts[:, :, None] * column_counts[:, None, :] / len(target)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if G_sq:
+            statistic = 2 * np.where(counts > 0, counts * np.log(counts / expected), 0).sum(axis=(1, 2))
+        else:
+            statistic = np.where(expected > 0, (counts - expected) ** 2 / expected, 0).sum(axis=(1, 2))
+    dof = ((row_counts > 0).sum(axis=1) - 1) * ((column_counts > 0).sum(axis=1) - 1)
+    return np.where(dof > 0, chdtrc(np.maximum(dof, 1), statistic), 1.)
+
+
+def correlation_screening(matrix: np.ndarray, target: np.ndarray):
+    """
+    Pearson correlation t-test of every column of the matrix against the target in one matrix product.
+    :param matrix: The answers, shape (samples, columns).
+    :param target: The answers of the variable of significance, shape (samples,).
+    :return: The p-value of every column.
+    """
+    n = len(target)
+    centered = matrix - matrix.mean(axis=0)
+    centered_target = target - target.mean()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = centered_target @ centered / np.sqrt((centered ** 2).sum(axis=0) * (centered_target ** 2).sum())
+        r = np.clip(np.nan_to_num(r), -1 + 1e-12, 1 - 1e-12)
+        t = r * np.sqrt((n - 2) / (1 - r ** 2))
+    return 2 * stdtr(n - 2, -np.abs(t))
+
+
+def kernel_pvalue(columns):
+    """
+    The kernel-based independence test of dowhy for a pair of columns (process pool task).
+    """
+    return gcm.independence_test(*columns)
+
+
+def screen_dependence(matrix: np.ndarray, target: np.ndarray, method: str = "kernel", alpha: float = 0.05,
+                      correction: str | None = None, borderline: tuple | None = None, n_jobs: int | None = 1):
+    """
+    Tests the marginal dependence of every column of the matrix on the target in one vectorized pass.
+    The columns whose p-value lies in the borderline range are tested again with the kernel-based test of dowhy,
+    in parallel.
+    :param matrix: The integer coded answers, shape (samples, columns).
+    :param target: The answers of the variable of significance, shape (samples,).
+    :param method: kernel (kernel test for every column, the default), chisq, gsq (mutual information) or correlation.
+    :param alpha: The significance level.
+    :param correction: The multiple-testing correction of statsmodels' multipletests (e.g. fdr_bh), None for none.
+    :param borderline: The (low, high) range of uncorrected p-values re-tested with the kernel test, None for none.
+    :param n_jobs: The number of processes of the kernel tests, 1 to run them in this process, None for all cores.
+    :return: The (corrected) p-value of every column.
+    """
+    if method not in SCREENING_METHODS:
+        raise ValueError(f"Unknown screening method: {method}, expected one of {SCREENING_METHODS}")
+
+    if method == "correlation":
+        p_values = correlation_screening(matrix.astype(float), target.astype(float))
+    elif method == "kernel":
+        p_values = np.full(matrix.shape[1], np.nan)
+    else:
+        p_values = contingency_screening(matrix, target, G_sq=method == "gsq")
+
+    if method == "kernel":
+        retest = np.arange(matrix.shape[1])
+    elif borderline is not None:
+        retest = np.flatnonzero((p_values >= borderline[0]) & (p_values <= borderline[1]))
+    else:
+        retest = np.empty(0, dtype=int)
+    if len(retest) > 0:
+        print(f"Running the kernel test for {len(retest)} columns...")
+        columns = ((matrix[:, i], target) for i in retest)
+        if n_jobs == 1:
+            p_values[retest] = list(map(kernel_pvalue, columns))
+        else:
+            with ProcessPoolExecutor(n_jobs) as pool:
+                p_values[retest] = list(pool.map(kernel_pvalue, columns))
+
+    if correction is not None:
+        p_values = multipletests(p_values, alpha=alpha, method=correction)[1]
+    return p_values
+
+
+def causal_search_space_reduction(questions: DataFrame, vos: str, output_file:str, method: str = "kernel",
+                                  alpha: float = 0.05, correction: str | None = None,
+                                  borderline: tuple | None = None, n_jobs: int | None = 1):
     """
     Reduces the search space by appling causal discovery on the set of questions.
+    By default every question is tested with the kernel test of dowhy at an uncorrected alpha, the faster
+    screening (e.g. method="chisq", correction="fdr_bh", borderline=(0.01, 0.1), n_jobs=None) is opt-in.
     :param questions: The questions as dataframe.
     :param vos: The variable of significant importance.
+    :param method: The screening test, see screen_dependence.
+    :param alpha: The significance level.
+    :param correction: The multiple-testing correction, None for none.
+    :param borderline: The range of p-values re-tested with the kernel test, None for none.
+    :param n_jobs: The number of processes of the kernel tests, 1 to run them in this process, None for all cores.
     :return: The reduced search space.
     """
     # dataframe_elements = []
@@ -25,21 +140,10 @@ def causal_search_space_reduction(questions: DataFrame, vos: str, output_file:st
     #
     # question_dataframe = pd.concat(dataframe_elements)
 
-    questions_drop = questions.fillna(0)
     vos_question = questions[vos].fillna(0)
 
-
-    #find string columns
-    str_columns = []
-    for c in questions_drop.columns:
-        str_col = questions_drop.loc[1:,c].apply(is_string)
-        if str_col.any():
-            str_columns.append(c)
-
-    # questions_np = np.delete(questions_drop, str_columns, axis=1)
-    questions_np = questions_drop.drop(str_columns, axis=1)
-    questions_np_header = list(questions_drop.drop(str_columns, axis=1).columns)
-    questions_np = questions_np.to_numpy().astype(int)
+    # numeric answers as a compact integer matrix, string columns are dropped
+    questions_np, questions_np_header = build_survey_matrix(questions, fill_value=0)
     # account for numpy error
     # questions_np = np.delete(questions_np, [75], axis=1).astype(int)
 
@@ -58,11 +162,10 @@ def causal_search_space_reduction(questions: DataFrame, vos: str, output_file:st
     # columns_to_delete = [j for (i,j) in same_columns]
     # questions_np = np.delete(questions_np, columns_to_delete, axis=1)
 
-    p_values = []
-    for i in range(questions_np.shape[1]):
-        p_values.append(gcm.independence_test(questions_np[:,i], vos_question))
+    p_values = screen_dependence(questions_np, vos_question.to_numpy(), method=method, alpha=alpha,
+                                 correction=correction, borderline=borderline, n_jobs=n_jobs)
 
-    dependent_questions = np.array(p_values) < 0.05
+    dependent_questions = p_values < alpha
 
     graph_edges = []
     for i in range(len(dependent_questions)):
@@ -94,16 +197,84 @@ def causal_search_space_reduction(questions: DataFrame, vos: str, output_file:st
     return causal_graph
 
 
-def causal_pattern_importance_assessment(patterns: list, patterns_to_questions: dict, sov, threshold: float):
-    confounder_patterns = []
-    for pattern in patterns:
-        result = gcm.independence_test(pattern, sov, conditioned_on=patterns_to_questions[pattern])
+def condition_basis(conditions: np.ndarray):
+    """
+    Orthonormal basis of the intercept and the conditioning columns (rank-deficient columns are dropped).
+    :param conditions: The conditioning answers, shape (samples, k).
+    :return: The basis, shape (samples, rank).
+    """
+    design = np.column_stack([np.ones(len(conditions)), conditions])
+    u, s, _ = np.linalg.svd(design, full_matrices=False)
+    return u[:, s > s[0] * max(design.shape) * np.finfo(float).eps]
+
+
+def partial_correlation_pvalues(patterns: np.ndarray, sov: np.ndarray, conditions: np.ndarray):
+    """
+    Tests all patterns of one conditioning set against the sov at once: the conditioning block is residualised
+    once and the partial correlations of all patterns with the sov are tested with a t-test.
+    :param patterns: The pattern values, shape (samples, patterns).
+    :param sov: The values of the switching variable, shape (samples,).
+    :param conditions: The conditioning answers shared by the patterns, shape (samples, k).
+    :return: The p-value of every pattern.
+    """
+    basis = condition_basis(conditions)
+    residual_patterns = patterns - basis @ (basis.T @ patterns)
+    residual_sov = sov - basis @ (basis.T @ sov)
+
+    scale = np.sqrt((residual_patterns ** 2).sum(axis=0) * (residual_sov ** 2).sum())
+    # patterns fully explained by the conditioning set carry no further dependence
+    determined = scale <= np.finfo(float).eps * len(sov)
+    r = residual_sov @ residual_patterns / np.where(determined, 1., scale)
+    r = np.clip(r, -1 + 1e-12, 1 - 1e-12)
+    dof = len(sov) - basis.shape[1] - 1
+    t = r * np.sqrt(dof / (1 - r ** 2))
+    return np.where(determined, 1., 2 * stdtr(dof, -np.abs(t)))
+
+
+def causal_pattern_importance_assessment(patterns: list, patterns_to_questions: dict, sov, threshold: float,
+                                         method: str = "kernel", n_jobs: int | None = 1):
+    """
+    Finds the patterns which are dependent on the sov given the questions of the pattern.
+    By default every pattern is tested with the kernel test of dowhy. The partial_correlation method is opt-in:
+    the patterns are grouped by their conditioning data, every group is residualised once and tested at once.
+    :param patterns: The patterns, the values of every pattern per respondent.
+    :param patterns_to_questions: The conditioning answers of every pattern, shape (samples,) or (samples, k).
+    :param sov: The values of the switching variable.
+    :param threshold: The significance level.
+    :param method: kernel (dowhy's kernel test per pattern, the default) or partial_correlation (batched linear test).
+    :param n_jobs: The number of processes for the partial_correlation groups, None for all cores, 1 to run them in this process.
+    :return: The patterns which fail the independence test.
+    """
+    if method not in ASSESSMENT_METHODS:
+        raise ValueError(f"Unknown assessment method: {method}, expected one of {ASSESSMENT_METHODS}")
+
+    if method == "kernel":
+        p_values = [gcm.independence_test(pattern, sov, conditioned_on=patterns_to_questions[pattern])
+                    for pattern in patterns]
+    else:
+        # group the patterns by the content of their conditioning data
+        groups = {}
+        for i, pattern in enumerate(patterns):
+            conditions = np.asarray(patterns_to_questions[pattern], dtype=float)
+            conditions = conditions.reshape(len(conditions), -1)
+            key = (conditions.shape, hashlib.sha1(np.ascontiguousarray(conditions).tobytes()).hexdigest())
+            groups.setdefault(key, (conditions, []))[1].append(i)
+
+        sov_values = np.asarray(sov, dtype=float)
+        tasks = [(np.column_stack([np.asarray(patterns[i], dtype=float) for i in indices]), sov_values, conditions)
+                 for conditions, indices in groups.values()]
+        if n_jobs == 1:
+            results = [partial_correlation_pvalues(*task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(n_jobs) as pool:
+                results = list(pool.map(partial_correlation_pvalues, *zip(*tasks)))
 
-        # add the patterns to the result, which fail the independence test
-        if result < threshold:
-            confounder_patterns.append(pattern)
+        p_values = np.empty(len(patterns))
+        for (_, indices), group_p_values in zip(groups.values(), results):
+            p_values[indices] = group_p_values
 
-    return confounder_patterns
+    # add the patterns to the result, which fail the independence test
+    return [pattern for pattern, p in zip(patterns, p_values) if p < threshold]
 
 
 def causal_pattern_inference(patterns: list, sov, threshold: float):
@@ -1,9 +1,12 @@
 import re
+from pathlib import Path
 from typing import Callable
 
 import numpy as np
 import pandas as pd
 import causallearn.search as cl
+
+from data_formatting.question_store import has_question_store, load_question_store
 # Deprecated
 class ObservationalRandomVariable:
     def __init__(self,generator: Callable[[int],np.ndarray], description: pd.DataFrame):
@@ -23,30 +26,44 @@ class ObservationalRandomVariable:
         """
         return self.generator(n)
 
-def define_random_variable_for_question_table(question_table:pd.DataFrame)-> ObservationalRandomVariable:
-    # find labels and probabilities per label of total distribution of question
-    #TODO differentiate first column "Gesamt" or not
-    row_headers = question_table.iloc[:,0]
-    row_headers = row_headers.dropna(inplace=False)
-
-    # find last row with a total number value (n <*>) and Summe
+def find_label_rows(row_headers: pd.Series) -> tuple[int, int]:
+    """
+    Finds the label rows of the first table of a question in one pass over the row headers.
+    :param row_headers: The row headers (first column) of the question table.
+    :return: The row index of the last total number row (n <*>) before the first Summe row and of that Summe row,
+    -1 if there is none.
+    """
     last_row_total_numbers = -1
-    sum_row = -1
-    for row_header in row_headers:
+    for index, row_header in row_headers.dropna().items():
+        if row_header == "Summe":
+            return last_row_total_numbers, index
         if re.fullmatch("n .*", row_header) is not None:
-            # save row index of last row seen with numerical data
-            last_row_total_numbers = row_headers[row_headers==row_header].index[0]
-
-        elif row_header == "Summe":
-            # save row index of sum row
-            sum_row = row_headers[row_headers==row_header].index[0]
-
-    label_names = question_table.iloc[last_row_total_numbers+1:sum_row,0]
-    label_probabilities = question_table.iloc[last_row_total_numbers+1:sum_row,1]/100
-    label_numbers = list(range(sum_row - last_row_total_numbers -1))
-    random_variable_table = pd.DataFrame({"label_names":label_names,
-                                          "label_numbers": label_numbers,
-                                          "label_probabilities":label_probabilities})
+            last_row_total_numbers = index
+    return last_row_total_numbers, -1
+
+
+def question_distribution(question_table: pd.DataFrame) -> pd.DataFrame:
+    """
+    Reads the labels of a question and their probabilities in the total distribution (Gesamt column).
+    :param question_table: The question table.
+    :return: The labels with their names, numbers and probabilities.
+    """
+    #TODO differentiate first column "Gesamt" or not
+    last_row_total_numbers, sum_row = find_label_rows(question_table.iloc[:, 0])
+    if sum_row < 0:
+        # no labelled table in the question
+        last_row_total_numbers, sum_row = -1, 0
+    label_names = question_table.iloc[last_row_total_numbers+1:sum_row, 0]
+    label_probabilities = pd.to_numeric(question_table.iloc[last_row_total_numbers+1:sum_row, 1], errors="coerce")/100
+    return pd.DataFrame({"label_names": label_names,
+                         "label_numbers": list(range(len(label_names))),
+                         "label_probabilities": label_probabilities})
+
+
+def define_random_variable_for_question_table(question_table:pd.DataFrame)-> ObservationalRandomVariable:
+    # find labels and probabilities per label of total distribution of question
+    random_variable_table = question_distribution(question_table)
+    label_probabilities = random_variable_table["label_probabilities"]
     # print(random_variable_table)
     # define random variable
     random_variable_generator = lambda num_samples: np.random.choice(np.array(random_variable_table["label_numbers"]),
@@ -55,6 +72,95 @@ def define_random_variable_for_question_table(question_table:pd.DataFrame)-> Obs
     return ObservationalRandomVariable(random_variable_generator, random_variable_table)
 
 
+def build_alias_tables(probabilities: np.ndarray, n_labels: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Builds the Walker alias tables (Vose's method) for every row of a probability matrix.
+    :param probabilities: The label probabilities, one question per row, padded with zeros.
+    :param n_labels: The number of labels of every question.
+    :return: The acceptance probability and the alias label of every (question, label) cell.
+    """
+    n_questions, max_labels = probabilities.shape
+    acceptance = np.ones((n_questions, max_labels))
+    alias = np.tile(np.arange(max_labels), (n_questions, 1))
+    for q in range(n_questions):
+        scaled = probabilities[q, :n_labels[q]] * n_labels[q]
+        small = [i for i in range(n_labels[q]) if scaled[i] < 1]
+        large = [i for i in range(n_labels[q]) if scaled[i] >= 1]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            acceptance[q, s] = scaled[s]
+            alias[q, s] = l
+            scaled[l] -= 1 - scaled[s]
+            (small if scaled[l] < 1 else large).append(l)
+        # the rest is 1 up to rounding errors
+        for i in small + large:
+            acceptance[q, i] = 1
+    return acceptance, alias
+
+
+class SyntheticRespondentGenerator:
+    def __init__(self, question_tables: dict[str, pd.DataFrame]):
+        """
+        Generates synthetic respondents from the total answer distributions of the question tables.
+        All tables are parsed once into one probability matrix (one row per question, padded with zeros)
+        with Walker alias tables, so all questions are sampled in one vectorized call.
+        :param question_tables: The question tables by question name. Tables without labels are skipped.
+        """
+        self.questions = []
+        self.descriptions = {}
+        distributions = []
+        for question, question_table in question_tables.items():
+            description = question_distribution(question_table)
+            probabilities = description["label_probabilities"].fillna(0).to_numpy(dtype=float)
+            if len(probabilities) == 0 or probabilities.sum() <= 0:
+                print(f"Skipping {question}: no label distribution found")
+                continue
+            self.questions.append(question)
+            self.descriptions[question] = description
+            distributions.append(probabilities / probabilities.sum())
+
+        self.n_labels = np.array([len(d) for d in distributions], dtype=np.int64)
+        self.probabilities = np.zeros((len(distributions), self.n_labels.max(initial=0)))
+        for q, distribution in enumerate(distributions):
+            self.probabilities[q, :len(distribution)] = distribution
+        self.acceptance, self.alias = build_alias_tables(self.probabilities, self.n_labels)
+
+    def sample(self, n: int, seed=None, chunk_size: int = 100_000) -> np.ndarray:
+        """
+        Draws n synthetic respondents.
+        :param n: The number of respondents.
+        :param seed: The seed or np.random.Generator.
+        :param chunk_size: The number of respondents drawn at once, bounds the temporary memory.
+        :return: The label numbers, shape (n, questions), in the order of self.questions.
+        """
+        rng = np.random.default_rng(seed)
+        dtype = np.int8 if self.probabilities.shape[1] <= np.iinfo(np.int8).max else np.int16
+        samples = np.empty((n, len(self.questions)), dtype=dtype)
+        # flat (question, label) cell offsets of every question
+        row_offsets = (np.arange(len(self.questions)) * self.probabilities.shape[1]).astype(np.int32)
+        # single precision halves the memory traffic, enough for sampling from survey percentages
+        acceptance, alias = self.acceptance.ravel().astype(np.float32), self.alias.ravel().astype(dtype)
+        n_labels = self.n_labels.astype(np.float32)
+        last_labels = (self.n_labels - 1).astype(np.int32)
+        for start in range(0, n, chunk_size):
+            stop = min(start + chunk_size, n)
+            # one uniform per draw: its integer part picks a label uniformly, its fractional part decides
+            # whether the label is kept (with its acceptance probability) or replaced by its alias
+            scaled = rng.random((stop - start, len(self.questions)), dtype=np.float32) * n_labels
+            # float32 rounding can give u * k == k for u just below 1
+            labels = np.minimum(scaled.astype(np.int32), last_labels)
+            cells = labels + row_offsets
+            keep = scaled - labels < acceptance[cells]
+            samples[start:stop] = np.where(keep, labels, alias[cells])
+        return samples
+
+    def sample_dataframe(self, n: int, seed=None) -> pd.DataFrame:
+        """
+        Draws n synthetic respondents as a DataFrame with one column per question.
+        """
+        return pd.DataFrame(self.sample(n, seed), columns=self.questions)
+
+
 def define_random_variables_for_question_tables(question_tables:list[pd.DataFrame])-> list[ObservationalRandomVariable]:
     random_variables = []
     for question_table in question_tables:
@@ -66,4 +172,14 @@ if __name__ == '__main__':
     question_table = pd.read_csv('../formatted_data/Kundenmonitor_GKV_2023/Band/Question_1.csv')
     r = define_random_variable_for_question_table(question_table)
     print(type(r))
-    print(r(100))
\ No newline at end of file
+    print(r.sample(100))
+
+    band_path = Path('../formatted_data/Kundenmonitor_GKV_2023/Band')
+    if has_question_store(band_path / 'store'):
+        store = load_question_store(band_path / 'store')
+        question_tables = {store.schema(n)['name']: store.table(n) for n in store}
+    else:
+        question_tables = {f.stem: pd.read_csv(f) for f in sorted(band_path.glob('Question_*.csv'))}
+    generator = SyntheticRespondentGenerator(question_tables)
+    respondents = generator.sample_dataframe(1_000_000, seed=0)
+    print(respondents.shape)
\ No newline at end of file
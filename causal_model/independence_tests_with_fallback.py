@@ -1,12 +1,23 @@
+import atexit
+import hashlib
+import os
+import sqlite3
 import warnings
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 from math import sqrt, log
 
 import numpy as np
 from causallearn.search.ConstraintBased.FCI import reorientAllWith, rule0, removeByPossibleDsep, rulesR1R2cycle, ruleR3, \
     ruleR4B, ruleR5, ruleR6, ruleR7, rule8, rule9, rule10, get_color_edges
 from causallearn.utils.cit import CIT_Base
+from scipy.linalg import solve_triangular
+from scipy.special import chdtrc
 from scipy.stats import norm
 from statsmodels.tools.sm_exceptions import ValueWarning
+from tqdm.auto import tqdm
+
+from data_formatting.survey_matrix import integer_codes
 
 # from __future__ import annotations
 
@@ -16,6 +27,7 @@ from typing import List, Set, Tuple, Dict, Generator
 from numpy import ndarray
 
 from causallearn.graph.Edge import Edge
+from causallearn.graph.GraphClass import CausalGraph
 from causallearn.graph.Endpoint import Endpoint
 from causallearn.graph.Graph import Graph
 from causallearn.graph.GraphNode import GraphNode
@@ -25,12 +37,13 @@ from causallearn.utils.DepthChoiceGenerator import DepthChoiceGenerator
 from causallearn.utils.cit import *
 from causallearn.utils.FAS import fas
 from causallearn.utils.PCUtils.BackgroundKnowledge import BackgroundKnowledge
+from causallearn.utils.PCUtils.Helper import append_value
 from itertools import combinations
 
 
 def fci(dataset: ndarray, independence_test_method: str = fisherz, alpha: float = 0.05, depth: int = -1,
         max_path_length: int = -1, verbose: bool = False, background_knowledge: BackgroundKnowledge | None = None,
-        show_progress: bool = True, node_names=None,
+        show_progress: bool = True, node_names=None, n_jobs: int | None = 1,
         **kwargs) -> Tuple[Graph, List[Edge]]:
     """
     Perform Fast Causal Inference (FCI) algorithm for causal discovery
@@ -50,6 +63,11 @@ def fci(dataset: ndarray, independence_test_method: str = fisherz, alpha: float
     max_path_length: the maximum length of any discriminating path, or -1 if unlimited.
     verbose: True is verbose output should be printed or logged
     background_knowledge: background knowledge
+    n_jobs: number of processes for the tests of the adjacency search, 1 (default) to run them in this process,
+            None for all cores
+    pvalue_db: optional path of an SQLite p-value cache shared between runs and workers (passed on to FisherZ_F and
+            Chisq_or_Gsq_F, other tests raise a ValueError), cannot be combined with causallearn's JSON cache_path.
+            The cache is closed at the end of the run
 
     Returns
     -------
@@ -72,8 +90,16 @@ def fci(dataset: ndarray, independence_test_method: str = fisherz, alpha: float
     if dataset.shape[0] < dataset.shape[1]:
         warnings.warn("The number of features is much larger than the sample size!")
 
-    # independence_test_method = CIT(dataset, method=independence_test_method, **kwargs)
-    independence_test_method = FisherZ_F(dataset, **kwargs)
+    if independence_test_method == fisherz:
+        independence_test_method = FisherZ_F(dataset, **kwargs)
+    elif independence_test_method in (chisq, gsq):
+        # survey answers are categorical codes, contingency table tests fit them better than Fisher-Z
+        independence_test_method = Chisq_or_Gsq_F(dataset, independence_test_method, **kwargs)
+    elif kwargs.get('pvalue_db') is not None:
+        raise ValueError(f"pvalue_db is only supported for {fisherz}, {chisq} and {gsq}, "
+                         f"not for {independence_test_method}")
+    else:
+        independence_test_method = CIT(dataset, method=independence_test_method, **kwargs)
     ## ------- check parameters ------------
     if (depth is None) or type(depth) != int:
         raise TypeError("'depth' must be 'int' type!")
@@ -92,9 +118,10 @@ def fci(dataset: ndarray, independence_test_method: str = fisherz, alpha: float
         nodes.append(node)
 
     # FAS (“Fast Adjacency Search”) is the adjacency search of the PC algorithm, used as a first step for the FCI algorithm.
-    graph, sep_sets, test_results = fas(dataset, nodes, independence_test_method=independence_test_method, alpha=alpha,
-                                        knowledge=background_knowledge, depth=depth, verbose=verbose,
-                                        show_progress=show_progress)
+    # PC-stable like causallearn's fas, but with all tests of a depth run as one parallel batch
+    graph, sep_sets, test_results = parallel_fas(dataset, nodes, independence_test_method=independence_test_method,
+                                                 alpha=alpha, knowledge=background_knowledge, depth=depth,
+                                                 verbose=verbose, show_progress=show_progress, n_jobs=n_jobs)
 
     # pdb.set_trace()
     reorientAllWith(graph, Endpoint.CIRCLE)
@@ -144,6 +171,9 @@ def fci(dataset: ndarray, independence_test_method: str = fisherz, alpha: float
         # rule 10
         change_flag = rule10(graph, change_flag)
 
+    if isinstance(independence_test_method.pvalue_cache, PValueCache):
+        independence_test_method.pvalue_cache.close()
+
     graph.set_pag(True)
 
     edges = get_color_edges(graph)
@@ -151,12 +181,392 @@ def fci(dataset: ndarray, independence_test_method: str = fisherz, alpha: float
     return graph, edges
 
 
+def parallel_fas(data: ndarray, nodes: List[Node], independence_test_method: CIT_Base, alpha: float = 0.05,
+                 knowledge: BackgroundKnowledge | None = None, depth: int = -1, verbose: bool = False,
+                 show_progress: bool = True, n_jobs: int | None = 1, chunk_size: int = 2048):
+    """
+    Stable fast adjacency search (same result as causallearn's fas with stable=True).
+    The adjacencies only change between depths, so all tests of a depth are collected first and run as one batch:
+    Fisher-Z tests are spread over a process pool that reads the correlation matrix from shared memory,
+    other tests are run one after the other. The edges are removed once all tests of the depth are done.
+
+    Parameters
+    ----------
+    data: data set (numpy ndarray), shape (n_samples, n_features)
+    nodes: The search nodes.
+    independence_test_method: the independence test, an instance of CIT_Base
+    alpha: float, desired significance level of independence tests (p_value) in (0,1)
+    knowledge: background knowledge
+    depth: the depth for the fast adjacency search, or -1 if unlimited
+    verbose: True is verbose output should be printed or logged
+    show_progress: whether to use tqdm to show progress bar
+    n_jobs: number of processes, 1 (default) to run the tests in this process, None for all cores
+    chunk_size: number of tests sent to a process at once
+
+    Returns
+    -------
+    graph: Causal graph skeleton, where graph.graph[i,j] = graph.graph[j,i] = -1 indicates i --- j.
+    sep_sets: Separated sets of graph
+    test_results: Results of conditional independence tests
+    """
+    if depth == -1:
+        depth = float('inf')
+
+    no_of_var = data.shape[1]
+    cg = CausalGraph(no_of_var, [node.get_name() for node in nodes])
+    cg.set_ind_test(independence_test_method)
+    sep_sets: Dict[Tuple[int, int], Set[int]] = {}
+    test_results: Dict[Tuple[int, int, Set[int]], float] = {}
+
+    def remove_if_exists(x: int, y: int) -> None:
+        edge = cg.G.get_edge(cg.G.nodes[x], cg.G.nodes[y])
+        if edge is not None:
+            cg.G.remove_edge(edge)
+
+    pool, block = None, None
+    if n_jobs != 1:
+        if isinstance(independence_test_method, FisherZ_F):
+            correlation_matrix = independence_test_method.correlation_matrix
+            block = shared_memory.SharedMemory(create=True, size=correlation_matrix.nbytes)
+            np.ndarray(correlation_matrix.shape, dtype=np.float64, buffer=block.buf)[...] = correlation_matrix
+            initargs = (None, (block.name, correlation_matrix.shape, independence_test_method.sample_size))
+        else:
+            # other tests are pickled to every worker once
+            initargs = (independence_test_method, None)
+        pool = ProcessPoolExecutor(n_jobs, initializer=init_worker, initargs=initargs)
+
+    try:
+        current_depth = -1
+        while cg.max_degree() - 1 > current_depth and current_depth < depth:
+            current_depth += 1
+
+            # every (x, y) edge with its conditioning sets, from the adjacencies at the start of the depth
+            pairs = []
+            tests = []
+            for x in range(no_of_var):
+                Neigh_x = cg.neighbors(x)
+                if len(Neigh_x) < current_depth - 1:
+                    continue
+                for y in Neigh_x:
+                    Neigh_x_noy = np.delete(Neigh_x, np.where(Neigh_x == y))
+                    condition_sets = list(combinations(Neigh_x_noy, current_depth))
+                    pairs.append((x, y, condition_sets))
+                    tests.extend((x, y, S) for S in condition_sets)
+
+            p_values = run_ci_tests(independence_test_method, tests, pool, chunk_size,
+                                    f'Depth={current_depth}' if show_progress else None)
+
+            edge_removal = set()
+            position = 0
+            for x, y, condition_sets in pairs:
+                if (knowledge is not None and
+                        knowledge.is_forbidden(cg.G.nodes[x], cg.G.nodes[y])
+                        and knowledge.is_forbidden(cg.G.nodes[y], cg.G.nodes[x])):
+                    edge_removal.add((x, y))
+                    edge_removal.add((y, x))
+
+                sepsets = set()
+                for S in condition_sets:
+                    p = p_values[position]
+                    position += 1
+                    test_results[(x, y, S)] = p
+                    if p > alpha:
+                        if verbose:
+                            print('%d ind %d | %s with p-value %f\n' % (x, y, S, p))
+                        edge_removal.add((x, y))
+                        edge_removal.add((y, x))
+                        sepsets.update(S)
+                    elif verbose:
+                        print('%d dep %d | %s with p-value %f\n' % (x, y, S, p))
+                append_value(cg.sepset, x, y, tuple(sepsets))
+                append_value(cg.sepset, y, x, tuple(sepsets))
+
+            for (x, y) in edge_removal:
+                remove_if_exists(x, y)
+                if cg.sepset[x, y] is not None:
+                    origin_set = set(l_in for l_out in cg.sepset[x, y] for l_in in l_out)
+                    sep_sets[(x, y)] = origin_set
+                    sep_sets[(y, x)] = origin_set
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if block is not None:
+            block.close()
+            block.unlink()
+
+    return cg.G, sep_sets, test_results
+
+
+def run_ci_tests(independence_test_method, tests, pool=None, chunk_size=2048, description=None):
+    """
+    p-values of a list of (X, Y, condition_set) tests. Without a pool Fisher-Z tests are batched and other tests
+    called one by one, with a pool every distinct uncached test is run once in one of the workers.
+    """
+    if pool is None:
+        if isinstance(independence_test_method, FisherZ_F):
+            return independence_test_method.batch(tests)
+        tests = tqdm(tests, desc=description) if description else tests
+        return np.array([independence_test_method(x, y, S) for x, y, S in tests], dtype=float)
+
+    cache = independence_test_method.pvalue_cache
+    p_values = np.empty(len(tests))
+    todo = {}
+    independence_test_method.save_to_local_cache()
+    for i, (X, Y, condition_set) in enumerate(tests):
+        test, cache_key = format_test(X, Y, condition_set)
+        if cache_key in cache:
+            p_values[i] = cache[cache_key]
+        else:
+            todo.setdefault(cache_key, (test, []))[1].append(i)
+
+    # chunks of tests sorted by conditioning set, so a chunk shares as many conditioning sets as possible
+    keys = sorted(todo, key=lambda key: todo[key][0][2])
+    chunks = [keys[start:start + chunk_size] for start in range(0, len(keys), chunk_size)]
+    futures = [pool.submit(ci_test_chunk, [todo[key][0] for key in chunk]) for chunk in chunks]
+    if description:
+        futures_progress = tqdm(futures, desc=description)
+    else:
+        futures_progress = futures
+
+    any_singular = False
+    for chunk, future in zip(chunks, futures_progress):
+        p, singular = future.result()
+        any_singular = any_singular or singular.any()
+        for key, p_value, is_singular in zip(chunk, p, singular):
+            p_values[todo[key][1]] = p_value
+            if not is_singular:
+                cache[key] = float(p_value)
+    if any_singular:
+        warnings.warn("Data correlation matrix is singular. Cannot run fisherz test. Please check your data.", ValueWarning)
+    return p_values
+
+
+# state of the process pool workers: the independence test, or the Fisher-Z correlation matrix in shared memory
+_worker_test = None
+_shared_block = None
+_shared_correlation = None
+
+
+def init_worker(independence_test_method, shared_correlation):
+    """
+    Process pool initializer: keep the test of the worker, or attach the shared correlation matrix
+    instead of pickling it to every task
+    """
+    global _worker_test, _shared_block, _shared_correlation
+    _worker_test = independence_test_method
+    if shared_correlation is not None:
+        block_name, shape, sample_size = shared_correlation
+        _shared_block = shared_memory.SharedMemory(name=block_name)
+        _shared_correlation = (np.ndarray(shape, dtype=np.float64, buffer=_shared_block.buf), sample_size)
+
+
+def ci_test_chunk(tests):
+    """
+    Worker task: p-values of a chunk of tests and the mask of the singular ones
+    """
+    if _shared_correlation is not None:
+        correlation_matrix, sample_size = _shared_correlation
+        return fisherz_pvalues(correlation_matrix, sample_size, tests)
+    p_values = np.array([_worker_test(X, Y, condition_set) for X, Y, condition_set in tests], dtype=float)
+    return p_values, np.zeros(len(tests), dtype=bool)
+
+
+# conditional variances (and 1 - r^2) at or below this count as a singular, collinear correlation matrix
+SINGULAR_TOLERANCE = 1e-10
+
+
+def residual_correlation(correlation_matrix, variables, condition_set):
+    '''
+    Correlation matrix of the variables after removing the linear effect of the condition_set
+    (Schur complement of the condition_set block), None if the condition_set block is singular
+    '''
+    C_UU = correlation_matrix[np.ix_(variables, variables)]
+    if not condition_set:
+        return C_UU
+    C_US = correlation_matrix[np.ix_(variables, condition_set)]
+    C_SS = correlation_matrix[np.ix_(condition_set, condition_set)]
+    try:
+        L = np.linalg.cholesky(C_SS)
+    except np.linalg.LinAlgError:
+        return None
+    if np.diag(L).min() ** 2 <= SINGULAR_TOLERANCE:
+        return None
+    A = solve_triangular(L, C_US.T, lower=True)
+    return C_UU - A.T @ A
+
+
+def fisherz_pvalues(correlation_matrix, sample_size, tests):
+    '''
+    Fisher-Z p-values of (X, Y, condition_set) tests, grouped by their conditioning set S. For every group the
+    residual correlation matrix C_UU - C_US C_SS^-1 C_SU of all variables U tested in it is computed from one
+    Cholesky factor of C_SS, all partial correlations of the group are read from it.
+    Both FisherZ_F.__call__ and FisherZ_F.batch use this function, so a test gets the same p-value on either path.
+    Returns the p-values and a mask of the tests with a singular correlation matrix (their p-value is 0).
+    '''
+    p_values = np.empty(len(tests))
+    singular = np.zeros(len(tests), dtype=bool)
+    groups = {}
+    for i, (X, Y, condition_set) in enumerate(tests):
+        groups.setdefault(tuple(condition_set), []).append(i)
+
+    for condition_set, positions in groups.items():
+        xs = [tests[i][0] for i in positions]
+        ys = [tests[i][1] for i in positions]
+        variables, index = np.unique(xs + ys, return_inverse=True)
+        residual = residual_correlation(correlation_matrix, variables, list(condition_set))
+        if residual is None:
+            p_values[positions] = 0
+            singular[positions] = True
+            continue
+        xi, yi = index[:len(xs)], index[len(xs):]
+
+        variance = np.minimum(residual[xi, xi], residual[yi, yi])
+        scale = np.sqrt(np.abs(residual[xi, xi] * residual[yi, yi]))
+        r = residual[xi, yi] / np.where(variance <= SINGULAR_TOLERANCE, 1., scale)
+        degenerate = (variance <= SINGULAR_TOLERANCE) | (1 - r ** 2 <= SINGULAR_TOLERANCE)
+        r = np.clip(r, -(1. - np.finfo(float).eps), 1. - np.finfo(float).eps)
+        Z = np.arctanh(r)
+        X = sqrt(sample_size - len(condition_set) - 3) * np.abs(Z)
+        p = 2 * norm.sf(X)
+        p[degenerate] = 0
+        p_values[positions] = p
+        singular[positions] = degenerate
+    return p_values, singular
+
+
+def format_test(X, Y, condition_set):
+    '''
+    (X, Y, condition_set) with X < Y and a sorted condition_set, and its key in the p-value cache.
+    Same key as CIT_Base.get_formatted_XYZ_and_cachekey, without its per-call overhead.
+    '''
+    X, Y = (int(X), int(Y)) if X < Y else (int(Y), int(X))
+    condition_set = tuple(sorted(set(map(int, condition_set))))
+    if condition_set:
+        return (X, Y, condition_set), f"{X};{Y}|{'.'.join(map(str, condition_set))}"
+    return (X, Y, condition_set), f"{X};{Y}"
+
+
+def data_fingerprint(data):
+    '''
+    Hash of the full content, shape and dtype of a data matrix
+    (causallearn hashes str(data), which is truncated for large matrices)
+    '''
+    data = np.ascontiguousarray(data)
+    digest = hashlib.sha1(f"{data.shape}{data.dtype}".encode('utf-8'))
+    digest.update(data.tobytes())
+    return digest.hexdigest()
+
+
+class PValueCache:
+    def __init__(self, path, data_hash, method, initial=None, flush_every=1000):
+        '''
+        Persistent p-value cache, a dict of test key -> p-value backed by an SQLite table
+        keyed by (data_hash, method, test key). All p-values of the dataset and method are read when it is opened,
+        new ones are written in batches. Several processes can share one file, each one sees the p-values
+        written before it opened the cache.
+
+        :param path: The SQLite file.
+        :param data_hash: The fingerprint of the dataset, see data_fingerprint.
+        :param method: The name of the test method.
+        :param initial: Entries to start with (e.g. the metadata of the causallearn cache), they are not persisted.
+        :param flush_every: The number of new p-values after which they are written to the file.
+        '''
+        self.path = path
+        self.data_hash = data_hash
+        self.method = method
+        self.flush_every = flush_every
+        self.memory = dict(initial or {})
+        self.pending = {}
+        self.connection = None
+        rows = self.connect().execute("SELECT test, p FROM pvalues WHERE data_hash = ? AND method = ?",
+                                      (data_hash, method))
+        self.memory.update(rows)
+        # flush at exit unless the cache is closed before, close() removes the hook again
+        atexit.register(self.flush)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def connect(self):
+        if self.connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=60)
+            # WAL lets readers and one writer work at the same time
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS pvalues (data_hash TEXT, method TEXT, test TEXT, "
+                                    "p REAL, PRIMARY KEY (data_hash, method, test))")
+        return self.connection
+
+    def flush(self):
+        '''
+        Write the new p-values to the file
+        '''
+        if not self.pending:
+            return
+        connection = self.connect()
+        with connection:
+            connection.executemany("INSERT OR REPLACE INTO pvalues VALUES (?, ?, ?, ?)",
+                                   [(self.data_hash, self.method, test, p) for test, p in self.pending.items()])
+        self.pending = {}
+
+    def close(self):
+        '''
+        Write the new p-values to the file and close the connection, the cache is no longer kept alive until exit
+        '''
+        self.flush()
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        atexit.unregister(self.flush)
+
+    def __contains__(self, key):
+        return key in self.memory
+
+    def __getitem__(self, key):
+        return self.memory[key]
+
+    def __setitem__(self, key, value):
+        self.memory[key] = value
+        if isinstance(value, float):
+            self.pending[key] = value
+            if len(self.pending) >= self.flush_every:
+                self.flush()
+
+    def __getstate__(self):
+        # connections can't be pickled, a worker process opens its own one
+        self.flush()
+        state = self.__dict__.copy()
+        state['connection'] = None
+        return state
+
+
+def check_pvalue_storage(pvalue_db, cache_path):
+    '''
+    causallearn's JSON cache (cache_path) cannot store a PValueCache, only one of them can be used
+    '''
+    if pvalue_db is not None and cache_path is not None:
+        raise ValueError("pvalue_db and cache_path cannot be combined, use either the SQLite or the JSON p-value cache")
+
+
 class FisherZ_F(CIT_Base):
-    def __init__(self, data, **kwargs):
+    def __init__(self, data, pvalue_db=None, **kwargs):
+        '''
+        :param data: The data matrix, shape (n_samples, n_features).
+        :param pvalue_db: Optional path of an SQLite file to keep the p-values in between runs, see PValueCache.
+            Cannot be combined with causallearn's cache_path.
+        '''
+        check_pvalue_storage(pvalue_db, kwargs.get('cache_path'))
         super().__init__(data, **kwargs)
         self.check_cache_method_consistent('fisherz_f', NO_SPECIFIED_PARAMETERS_MSG)
         self.assert_input_data_is_valid()
         self.correlation_matrix = np.corrcoef(data.T)
+        if pvalue_db is not None:
+            self.pvalue_cache = PValueCache(pvalue_db, data_fingerprint(data), 'fisherz_f', initial=self.pvalue_cache)
 
     def __call__(self, X, Y, condition_set=None):
         '''
@@ -172,19 +582,142 @@ class FisherZ_F(CIT_Base):
         '''
         Xs, Ys, condition_set, cache_key = self.get_formatted_XYZ_and_cachekey(X, Y, condition_set)
         if cache_key in self.pvalue_cache: return self.pvalue_cache[cache_key]
-        var = Xs + Ys + condition_set
-        sub_corr_matrix = self.correlation_matrix[np.ix_(var, var)]
-        try:
-            inv = np.linalg.inv(sub_corr_matrix)
-        except np.linalg.LinAlgError:
+        # same kernel as batch, so singular tests are treated alike on both paths
+        p, singular = fisherz_pvalues(self.correlation_matrix, self.sample_size, [(Xs[0], Ys[0], tuple(condition_set))])
+        if singular[0]:
             warnings.warn("Data correlation matrix is singular. Cannot run fisherz test. Please check your data.", ValueWarning)
             return 0
+        p = float(p[0])
+        self.pvalue_cache[cache_key] = p
+        return p
+
+    def batch(self, tests):
+        '''
+        Perform many independence tests using Fisher-Z's test at once, see fisherz_pvalues.
+
+        Parameters
+        ----------
+        tests : list of (X, Y, condition_set) triples of column indices of data
+
+        Returns
+        -------
+        p : array of the p-values of the tests, in the order of tests
+        '''
+        p_values = np.empty(len(tests))
+        uncached = []
+        self.save_to_local_cache()
+        for i, (X, Y, condition_set) in enumerate(tests):
+            test, cache_key = format_test(X, Y, condition_set)
+            if cache_key in self.pvalue_cache:
+                p_values[i] = self.pvalue_cache[cache_key]
+            else:
+                uncached.append((i, test, cache_key))
+        if not uncached:
+            return p_values
+
+        positions, formatted, cache_keys = zip(*uncached)
+        p, singular = fisherz_pvalues(self.correlation_matrix, self.sample_size, formatted)
+        if singular.any():
+            warnings.warn("Data correlation matrix is singular. Cannot run fisherz test. Please check your data.", ValueWarning)
+        p_values[list(positions)] = p
+        # like the single test, singular tests get p = 0 and are not cached
+        for cache_key, p_value, is_singular in zip(cache_keys, p, singular):
+            if not is_singular:
+                self.pvalue_cache[cache_key] = float(p_value)
+        return p_values
+
+
+def contingency_pvalue(counts, G_sq=False):
+    '''
+    p-value of the chi-square (or G-square) test of conditional independence on stratified contingency tables.
+    Degrees of freedom like causallearn: (non-empty rows - 1) * (non-empty columns - 1), summed over the strata.
+
+    :param counts: The joint counts, shape (strata, cardinality of X, cardinality of Y), every stratum non-empty.
+    :param G_sq: Use the G-square instead of the chi-square statistic.
+    :return: The p-value.
+    '''
+    x_counts = counts.sum(axis=2)
+    y_counts = counts.sum(axis=1)
+    stratum_counts = x_counts.sum(axis=1)
+    expected = x_counts[:, :, None] * y_counts[:, None, :] / stratum_counts[:, None, None]
+    nonzero = expected > 0
+    if G_sq:
+        observed = counts > 0
+        statistic = 2 * np.sum(counts[observed] * np.log(counts[observed] / expected[observed]))
+    else:
+        statistic = np.sum((counts[nonzero] - expected[nonzero]) ** 2 / expected[nonzero])
+    dof = np.sum(((x_counts > 0).sum(axis=1) - 1) * ((y_counts > 0).sum(axis=1) - 1))
+    # chdtrc is chi2.sf without the overhead of the distribution object
+    return 1 if dof == 0 else chdtrc(dof, statistic)
+
+
+class Chisq_or_Gsq_F(CIT_Base):
+    def __init__(self, data, method_name=chisq, pvalue_db=None, max_cached_strata=4096, **kwargs):
+        '''
+        Chi-square / G-square test for categorical variables (e.g. Likert or choice answers).
+        Every variable is encoded as small integer codes once. The strata of a conditioning set are built from the
+        cached strata of its prefix, so the tests of one depth of the adjacency search share the work,
+        and the stratified contingency tables come from one np.bincount over the combined codes.
+
+        :param data: The data matrix, shape (n_samples, n_features).
+        :param method_name: chisq or gsq.
+        :param pvalue_db: Optional path of an SQLite file to keep the p-values in between runs, see PValueCache.
+            Cannot be combined with causallearn's cache_path.
+        :param max_cached_strata: The number of conditioning sets whose strata are kept.
+        '''
+        if method_name not in (chisq, gsq):
+            raise ValueError(f"Unknown contingency table test: {method_name}, expected {chisq} or {gsq}")
+        check_pvalue_storage(pvalue_db, kwargs.get('cache_path'))
+        super().__init__(data, **kwargs)
+        self.check_cache_method_consistent(method_name + '_f', NO_SPECIFIED_PARAMETERS_MSG)
+        self.assert_input_data_is_valid()
+        self.G_sq = method_name == gsq
+
+        self.codes, self.cardinalities = integer_codes(data)
 
-            # raise ValueError('Data correlation matrix is singular. Cannot run fisherz test. Please check your data.')
-        r = -inv[0, 1] / sqrt(abs(inv[0, 0] * inv[1, 1]))
-        if abs(r) >= 1: r = (1. - np.finfo(float).eps) * np.sign(r) # may happen when samplesize is very small or relation is deterministic
-        Z = 0.5 * log((1 + r) / (1 - r))
-        X = sqrt(self.sample_size - len(condition_set) - 3) * abs(Z)
-        p = 2 * (1 - norm.cdf(abs(X)))
+        self.max_cached_strata = max_cached_strata
+        # conditioning set -> (stratum code of every sample, number of strata)
+        self.strata = {(): (np.zeros(self.sample_size, dtype=np.int64), 1)}
+        if pvalue_db is not None:
+            self.pvalue_cache = PValueCache(pvalue_db, data_fingerprint(data), method_name + '_f',
+                                            initial=self.pvalue_cache)
+
+    def stratum_codes(self, condition_set):
+        '''
+        Stratum code of every sample for a sorted conditioning set, only the strata that occur are numbered
+        '''
+        condition_set = tuple(condition_set)
+        if condition_set in self.strata:
+            return self.strata[condition_set]
+
+        prefix_codes, _ = self.stratum_codes(condition_set[:-1])
+        last = condition_set[-1]
+        strata, codes = np.unique(prefix_codes * self.cardinalities[last] + self.codes[:, last], return_inverse=True)
+        if len(self.strata) > self.max_cached_strata:
+            # drop the oldest cached conditioning set, the empty one stays
+            del self.strata[next(key for key in self.strata if key)]
+        self.strata[condition_set] = (codes, len(strata))
+        return self.strata[condition_set]
+
+    def __call__(self, X, Y, condition_set=None):
+        '''
+        Perform an independence test using the chi-square (or G-square) test.
+
+        Parameters
+        ----------
+        X, Y and condition_set : column indices of data
+
+        Returns
+        -------
+        p : the p-value of the test
+        '''
+        Xs, Ys, condition_set, cache_key = self.get_formatted_XYZ_and_cachekey(X, Y, condition_set)
+        if cache_key in self.pvalue_cache: return self.pvalue_cache[cache_key]
+        x, y = Xs[0], Ys[0]
+        strata, n_strata = self.stratum_codes(condition_set)
+        card_x, card_y = self.cardinalities[x], self.cardinalities[y]
+        counts = np.bincount((strata * card_x + self.codes[:, x]) * card_y + self.codes[:, y],
+                             minlength=n_strata * card_x * card_y).reshape(n_strata, card_x, card_y)
+        p = float(contingency_pvalue(counts, self.G_sq))
         self.pvalue_cache[cache_key] = p
-        return p
\ No newline at end of file
+        return p
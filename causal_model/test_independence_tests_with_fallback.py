@@ -0,0 +1,76 @@
+import warnings
+
+import numpy as np
+import pytest
+from causallearn.utils.cit import CIT
+
+from independence_tests_with_fallback import Chisq_or_Gsq_F, FisherZ_F, PValueCache, data_fingerprint, fci
+
+
+def gaussian_data(seed=0, n=500):
+    rng = np.random.default_rng(seed)
+    z = rng.normal(size=n)
+    x = z + rng.normal(size=n)
+    y = z + rng.normal(size=n)
+    w = rng.normal(size=n)
+    return np.column_stack([x, y, z, w])
+
+
+def test_fisherz_matches_causallearn():
+    data = gaussian_data()
+    reference = CIT(data, "fisherz")
+    tests = [(0, 1, ()), (0, 1, (2,)), (0, 3, (1, 2)), (1, 3, (0,))]
+    batch = FisherZ_F(data).batch(tests)
+    for (X, Y, S), p_batch in zip(tests, batch):
+        assert np.isclose(FisherZ_F(data)(X, Y, S), reference(X, Y, S), rtol=1e-10, atol=1e-14)
+        assert np.isclose(p_batch, reference(X, Y, S), rtol=1e-10, atol=1e-14)
+
+
+def test_collinear_condition_set_same_in_serial_and_batch():
+    data = gaussian_data()
+    # the conditioning set {2, 4} is collinear
+    data = np.column_stack([data, 2 * data[:, 2]])
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        serial_test = FisherZ_F(data)
+        serial = serial_test(0, 1, [2, 4])
+        batch_test = FisherZ_F(data)
+        batch = batch_test.batch([(0, 1, (2, 4))])[0]
+    assert serial == batch == 0
+    assert any("singular" in str(warning.message) for warning in caught)
+    # singular tests are not cached on either path
+    assert "0;1|2.4" not in serial_test.pvalue_cache
+    assert "0;1|2.4" not in batch_test.pvalue_cache
+
+
+def test_pvalue_db_rejects_json_cache_path(tmp_path):
+    data = gaussian_data()
+    pvalue_db = str(tmp_path / "pvalues.sqlite")
+    cache_path = str(tmp_path / "pvalues.json")
+    with pytest.raises(ValueError):
+        FisherZ_F(data, pvalue_db=pvalue_db, cache_path=cache_path)
+    with pytest.raises(ValueError):
+        Chisq_or_Gsq_F((data > 0).astype(int), pvalue_db=pvalue_db, cache_path=cache_path)
+    with pytest.raises(ValueError):
+        fci(data, show_progress=False, pvalue_db=pvalue_db, cache_path=cache_path)
+
+
+def test_pvalue_db_rejected_for_other_tests(tmp_path):
+    with pytest.raises(ValueError):
+        fci(gaussian_data(), "kci", show_progress=False, pvalue_db=str(tmp_path / "pvalues.sqlite"))
+
+
+def test_pvalue_cache_is_closed_after_fci(tmp_path, monkeypatch):
+    data = gaussian_data()
+    pvalue_db = str(tmp_path / "pvalues.sqlite")
+    closed = []
+    close = PValueCache.close
+    monkeypatch.setattr(PValueCache, "close", lambda cache: (close(cache), closed.append(cache)))
+    for alpha in (0.01, 0.05):
+        fci(data, alpha=alpha, show_progress=False, pvalue_db=pvalue_db)
+    assert len(closed) == 2
+    assert all(cache.connection is None for cache in closed)
+    # the p-values of the runs are in the file
+    with PValueCache(pvalue_db, data_fingerprint(data), 'fisherz_f') as reopened:
+        assert len(reopened.memory) > 0
+    assert reopened.connection is None
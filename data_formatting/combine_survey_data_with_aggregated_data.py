@@ -1,53 +1,477 @@
+import csv
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 import pandas as pd
 from pandas.io.sas.sas_constants import column_name_offset_length
 
+from data_formatting.question_store import csv_column_names, has_question_store, load_question_store
 
-def get_question_columns(folderpath):
-    column_set = set()
-    for question_file in os.listdir(folderpath):
-        dataframe_columns = pd.read_csv(os.path.join(folderpath, question_file)).columns
-        # print(list(dataframe_columns))
-        column_set = column_set.union(set(list(dataframe_columns)))
 
-    column_set = sorted(column_set)
+def read_question_header(filepath) -> list:
+    """
+    Reads only the header line of a question table CSV.
+    :param filepath: The filepath of the question table.
+    :return: The column names, see question_store.csv_column_names.
+    """
+    with open(filepath, newline="", encoding="utf-8") as f:
+        return csv_column_names(next(csv.reader(f), []))
 
-    clean_column_set = set()
 
+def count_column_answers(columns) -> dict:
+    """
+    Counts the answer columns per column name, 'Alter', 'Alter.1' and 'Alter.2' are three answers of 'Alter'.
+    :param columns: The column names.
+    :return: The number of answers per column name.
+    """
     column_number_answers = dict()
-    for column in column_set:
-        column_str = str(column)
-
-        column_split = column_str.split(".")
-        column_name = column_split[0]
-        if column_name not in column_number_answers.keys():
+    for column in sorted(set(columns)):
+        column_name = column.split(".")[0]
+        if column_name not in column_number_answers:
             column_number_answers[column_name] = 1
-            clean_column_set.add(column_name)
-
-        elif len(column_split) > 1:
-            answer_number = column_split[1]
+        elif "." in column:
             column_number_answers[column_name] += 1
+    return column_number_answers
+
+
+class QuestionColumnRegistry:
+    def __init__(self, question_columns: dict):
+        """
+        The columns of all question tables, answers which question tables contain a column and how many answers
+        (e.g. 'Geschlecht', 'Geschlecht.1') a column has.
+        :param question_columns: The column names per question table name (e.g. Question_1).
+        """
+        self.question_columns = question_columns
+        self.question_answers = {question: count_column_answers(columns)
+                                 for question, columns in question_columns.items()}
+        self.column_number_answers = count_column_answers(
+            [column for columns in question_columns.values() for column in columns])
+        # column name -> question tables containing it
+        self.column_questions = dict()
+        for question, answers in self.question_answers.items():
+            for column_name in answers:
+                self.column_questions.setdefault(column_name, []).append(question)
+
+    def questions_with_column(self, column_name) -> list:
+        """
+        The question tables containing a column.
+        :param column_name: The column name, without answer suffix.
+        :return: The names of the question tables.
+        """
+        return self.column_questions.get(column_name, [])
+
+    def answer_columns(self, question, column_name) -> list:
+        """
+        The answer columns of a column in a question table, in table order.
+        :param question: The name of the question table.
+        :param column_name: The column name, without answer suffix.
+        :return: The answer column names (e.g. ['Geschlecht', 'Geschlecht.1']).
+        """
+        return [column for column in self.question_columns[question] if column.split(".")[0] == column_name]
+
+
+def build_question_column_registry(folderpath, max_workers=8) -> QuestionColumnRegistry:
+    """
+    Builds the column registry of the question tables of a folder. The columns are taken from the catalog of the
+    question store (folderpath/store) if there is one, otherwise only the header lines of the Question_<n>.csv files
+    are read, concurrently.
+    :param folderpath: The folder of the question tables.
+    :param max_workers: The number of threads reading the headers.
+    :return: The registry.
+    """
+    store_path = os.path.join(folderpath, "store")
+    if has_question_store(store_path):
+        store = load_question_store(store_path)
+        return QuestionColumnRegistry({store.schema(n)["name"]: store.schema(n)["columns"] for n in store})
+
+    question_files = sorted(f for f in os.listdir(folderpath) if re.fullmatch(r"Question_\d+\.csv", f))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        headers = executor.map(read_question_header, [os.path.join(folderpath, f) for f in question_files])
+        return QuestionColumnRegistry({f[:-len(".csv")]: columns for f, columns in zip(question_files, headers)})
+
+
+def get_question_columns(folderpath):
+    """
+    Prints the column names of all question tables and their number of answers.
+    :param folderpath: The folder of the question tables.
+    :return: The number of answers per column name.
+    """
+    registry = build_question_column_registry(folderpath)
+    print(sorted(registry.column_number_answers))
+    print(registry.column_number_answers)
+    return registry.column_number_answers
+
+
+# Band column (respondent grouping) per survey question
+COLUMN_MAPPING = {
+    "Q1": "Geschlecht",
+    "Q2": "Alter",
+    "Q4": "Bundesländer",
+    "Q9": "Gesetzliche Krankenkasse",
+}
+
+# Bundesland of the survey (Q4) -> category of the Band column "Bundesländer", all others are the same in both
+BAND_STATES = {
+    "Schleswig-Holstein": "Schl.-Holst.",
+    "Niedersachsen": "Nds.",
+    "Nordrhein-Westfalen": "NRW",
+    "Rheinland-Pfalz": "Rh.-Pfalz",
+    "Baden-Württemberg": "Baden-Württ.",
+    "Mecklenburg-Vorpommern": "Meck.-Vorp.",
+    "Sachsen-Anhalt": "Sachs.-Anhalt",
+}
+
+# Survey insurer (Q9) -> category of the Band column "Gesetzliche Krankenkasse", all others are "Sonstige GKV"
+BAND_INSURER_GROUPS = {
+    "AOK": "AOK",
+    "IKK classic": "IKK",
+    "IKK gesund plus": "IKK",
+    "IKK Südwest": "IKK",
+    "IKK - Die Innovationskasse": "IKK",
+    "IKK Brandenburg und Berlin": "IKK",
+    "BIG direkt gesund": "IKK",
+    "DAK Gesundheit": "DAK-Gesundheit",
+    "HEK - Hanseatische Krankenkasse": "HEK",
+    "hkk": "hkk",
+    "SBK": "BKK",
+    "Techniker Krankenkasse (TK)": "TK",
+    "KKH Kaufmännische Krankenkasse": "KKH",
+    "Knappschaft": "KNAPP-SCHAFT",
+    "Mobil Krankenkasse": "BKK",
+    "mhplus Betriebskrankenkasse": "BKK",
+    "Pronova BKK": "BKK",
+    "Audi BKK": "BKK",
+    "BAHN-BKK": "BKK",
+    "Barmer": "Barmer",
+    "BKK VBU": "BKK",
+    "VIACTIV Krankenkasse": "BKK",
+}
+
+# Insurer names of the survey and the aggregated data that differ by more than case and punctuation
+# -> one common name
+INSURER_ALIASES = {
+    "HEK - Hanseatische Krankenkasse": "HEK",
+    "Hanseatische Krankenkasse (HEK)": "HEK",
+    "KKH Kaufmännische Krankenkasse": "Kaufmännische Krankenkasse (KKH)",
+    "Landwirtschaftliche Krankenkasse (LKK)": "SVLFG",
+    "Mobil Krankenkasse": "Betriebskrankenkasse Mobil",
+    "mhplus Betriebskrankenkasse": "mhplus BKK",
+    "BKK VBU": "BKK mkk - meine Krankenkasse",
+    "BKK Verkehrsbau Union (BKK VBU)": "BKK mkk - meine Krankenkasse",
+    "AOK - Die Gesundheitskasse für Niedersachsen": "AOK Niedersachsen",
+    "AOK - Die Gesundheitskasse in Hessen": "AOK Hessen",
+    "AOK Bayern - Die Gesundheitskasse": "AOK Bayern",
+    "AOK Bremen / Bremerhaven": "AOK Bremen/Bremerhaven",
+    "AOK Nordost - Die Gesundheitskasse": "AOK Nordost",
+    "AOK NordWest - Die Gesundheitskasse": "AOK NordWest",
+    "AOK PLUS - Die Gesundheitskasse für Sachsen und Thüringen": "AOK PLUS",
+    "AOK Rheinland/Hamburg - Die Gesundheitskasse": "AOK Rheinland/Hamburg",
+    "AOK Rheinland-Pfalz/Saarland-Die Gesundheitskasse": "AOK Rheinland-Pfalz/Saarland",
+    "AOK Sachsen-Anhalt - Die Gesundheitskasse": "AOK Sachsen-Anhalt",
+    "BERGISCHE Krankenkasse": "DIE BERGISCHE KRANKENKASSE",
+    "Betriebskrankenkasse PricewaterhouseCoopers": "BKK PwC",
+    "BKK BPW Bergische Achsen KG": "BKK BPW Bergische Achsen",
+    "BKK Wirtschaft & Finanzen": "BKK Wirtschaft und Finanzen",
+    "BKK Schwarzwald-Baar-Heuberg": "BKK SBH",
+    "BKK der MTU Friedrichshafen": "BKK MTU",
+    "Ernst & Young BKK": "EY BKK",
+    "KARL MAYER BKK": "BKK Karl Mayer",
+    "Merck BKK": "BKK Merck",
+    "energie-Betriebskrankenkasse": "energie BKK",
+    "WMF Betriebskrankenkasse": "WMF BKK",
+}
+
+# Answer "Andere Krankenasse" of the insurer question (Q9), its respondents name their insurer in Q10
+OTHER_INSURER_ANSWER = 24
+
+# Aggregated data per insurer: file, sheet, join keys besides the insurer and the value columns
+AGGREGATED_SOURCES = {
+    "Marktanteile": ("Marktanteile je Kasse.xlsx", "data", ["Jahr"],
+                     ["Marktanteil Versicherte", "Marktanteil Mitglieder"]),
+    "Morbidity": ("Morbidity_Region.xlsx", "data", ["Jahr"],
+                  ["Risikofaktor", "RF-Entwicklung im Vgl zum Vorjahr"]),
+    "Zusatzbeitrag": ("Zusatzbeitrag_je Kasse je Quartal.xlsx", "Sheet1", ["Jahr", "Quartal"],
+                      ["Mitglieder", "Versicherte", "Zusatzbeitrag"]),
+}
+
+
+def insurer_key(names: pd.Series) -> pd.Series:
+    """
+    Join key of insurer names: aliases are replaced by their common name, case and punctuation are ignored.
+    :param names: The insurer names.
+    :return: The keys (e.g. 'technikerkrankenkassetk').
+    """
+    names = names.astype("string")
+    return names.replace(INSURER_ALIASES).str.casefold().str.replace(r"\W", "", regex=True)
+
+
+def read_codebook_labels(codebook: pd.DataFrame) -> dict:
+    """
+    Reads the answer labels of the single select questions from the Codebook sheet.
+    :param codebook: The Codebook sheet.
+    :return: The labels per question and answer value, e.g. {"Q1": {1: "Männlich", ...}}.
+    """
+    question = codebook["Question"].ffill()
+    values = pd.to_numeric(codebook["Value"], errors="coerce")
+    is_label = codebook["Question"].isna() & values.notna()
+    labels = dict()
+    for q, rows in codebook[is_label].groupby(question[is_label], sort=False):
+        labels[q] = dict(zip(values[rows.index].astype(int), rows["Label"].astype(str)))
+    return labels
+
+
+def decode_answers(answers: pd.Series, labels: dict) -> pd.Categorical:
+    """
+    Decodes the answer values of a question into their labels without a row-wise mapping.
+    :param answers: The answer values.
+    :param labels: The label per answer value.
+    :return: The labels as categorical, unknown and missing answers are NaN.
+    """
+    label_codes, categories = pd.factorize(pd.Series(list(labels.values()), dtype=object))
+    positions = pd.Index(list(labels.keys())).get_indexer(pd.to_numeric(answers, errors="coerce"))
+    codes = np.where(positions >= 0, label_codes[positions], -1)
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+
+def encode_join_keys(left: pd.DataFrame, right: pd.DataFrame, left_on: list, right_on: list):
+    """
+    Encodes the join keys of two tables as categoricals with shared categories and combines
+    the codes of several keys into one integer key.
+    :param left: The left table.
+    :param right: The right table.
+    :param left_on: The key columns of the left table.
+    :param right_on: The key columns of the right table, in the same order.
+    :return: The integer keys of the left and the right rows, -1 for rows with a missing key.
+    """
+    left_key = np.zeros(len(left), dtype=np.int64)
+    right_key = np.zeros(len(right), dtype=np.int64)
+    left_missing = np.zeros(len(left), dtype=bool)
+    right_missing = np.zeros(len(right), dtype=bool)
+    for left_column, right_column in zip(left_on, right_on):
+        categories = pd.Index(pd.concat([pd.Series(np.asarray(left[left_column], dtype=object)),
+                                         pd.Series(np.asarray(right[right_column], dtype=object))])
+                              .dropna().unique())
+        left_codes = pd.Categorical(np.asarray(left[left_column], dtype=object), categories=categories).codes
+        right_codes = pd.Categorical(np.asarray(right[right_column], dtype=object), categories=categories).codes
+        left_key = left_key * len(categories) + left_codes
+        right_key = right_key * len(categories) + right_codes
+        left_missing |= left_codes < 0
+        right_missing |= right_codes < 0
+    left_key[left_missing] = -1
+    right_key[right_missing] = -1
+    return left_key, right_key
+
+
+def hash_join(left: pd.DataFrame, right: pd.DataFrame, left_on: list, right_on: list, columns: list,
+              prefix="") -> pd.DataFrame:
+    """
+    Left join of columns of the right table onto the rows of the left table. The keys are encoded as shared
+    categorical codes and looked up in a hash index of the right keys.
+    Of right rows with the same key the first one is used.
+    :param left: The left table.
+    :param right: The right table.
+    :param left_on: The key columns of the left table.
+    :param right_on: The key columns of the right table, in the same order.
+    :param columns: The columns of the right table to join.
+    :param prefix: The prefix of the joined column names.
+    :return: The joined columns with the index of the left table, NaN for rows without a match.
+    """
+    left_key, right_key = encode_join_keys(left, right, left_on, right_on)
+    first_rows = np.flatnonzero(~pd.Index(right_key).duplicated() & (right_key >= 0))
+    positions = pd.Index(right_key[first_rows]).get_indexer(left_key)
+    positions[left_key < 0] = -1
+
+    if len(first_rows) == 0:
+        joined = right[columns].reindex(range(len(left)))
+    else:
+        joined = right[columns].iloc[first_rows[np.maximum(positions, 0)]]
+    joined = joined.set_axis(left.index).where(pd.Series(positions >= 0, index=left.index), axis=0)
+    return joined.add_prefix(prefix)
+
+
+def age_groups(ages: pd.Series, categories) -> pd.Categorical:
+    """
+    Bins ages into the age groups of the Band tables ('16-29 Jahre', ..., '70+ Jahre').
+    :param ages: The ages.
+    :param categories: The age group names.
+    :return: The age group per age, NaN outside of the groups.
+    """
+    lower_bounds = [int(re.match(r"\s*(\d+)", category).group(1)) for category in categories]
+    order = np.argsort(lower_bounds)
+    edges = [lower_bounds[i] for i in order]
+    last = re.search(r"(\d+)\s*Jahre", categories[order[-1]])
+    upper = np.inf if "+" in categories[order[-1]] or last is None else int(last.group(1)) + 1
+    return pd.cut(pd.to_numeric(ages, errors="coerce"), bins=edges + [upper], right=False,
+                  labels=[categories[i] for i in order])
+
+
+def band_label_rows(first_column: pd.Series):
+    """
+    The rows of the answer labels of the first table of a Band question: between the last 'n ...' row
+    and the first 'Summe' row.
+    :param first_column: The first column of the question table.
+    :return: The row positions of the labels, empty if the question has no 'Summe' row.
+    """
+    labels = first_column.astype("string").str.strip()
+    sum_rows = np.flatnonzero(labels.eq("Summe").fillna(False).to_numpy())
+    if len(sum_rows) == 0:
+        return np.empty(0, dtype=np.int64)
+    count_rows = np.flatnonzero(labels.iloc[:sum_rows[0]].str.match(r"n ").fillna(False).to_numpy())
+    first = count_rows[-1] + 1 if len(count_rows) else 1
+    return np.arange(first, sum_rows[0])
+
+
+def read_question_tables(folderpath, questions) -> dict:
+    """
+    Reads question tables from the question store of a folder if there is one, otherwise from the CSV files.
+    :param folderpath: The folder of the question tables.
+    :param questions: The names of the question tables (e.g. Question_1).
+    :return: The question tables by name.
+    """
+    store_path = os.path.join(folderpath, "store")
+    if has_question_store(store_path):
+        store = load_question_store(store_path)
+        return {question: store.table(int(question.split("_")[1])) for question in questions}
+    return {question: pd.read_csv(os.path.join(folderpath, question + ".csv")) for question in questions}
+
+
+def band_group_table(registry: QuestionColumnRegistry, question_tables: dict, column_name) -> pd.DataFrame:
+    """
+    The answer shares of all Band questions per category of a Band column, e.g. per 'Männlich' and 'Weiblich'
+    for 'Geschlecht'.
+    :param registry: The column registry of the question tables.
+    :param question_tables: The question tables by name.
+    :param column_name: The Band column.
+    :return: One row per category (column 'category') with a column '<question>: <label>' per answer label.
+    """
+    parts = []
+    for question in registry.questions_with_column(column_name):
+        table = question_tables[question]
+        label_rows = band_label_rows(table.iloc[:, 0])
+        if len(label_rows) == 0:
+            continue
+        answer_columns = registry.answer_columns(question, column_name)
+        shares = table.iloc[label_rows][answer_columns].apply(pd.to_numeric, errors="coerce").T / 100
+        shares.index = table.iloc[0][answer_columns].astype(str).to_numpy()
+        shares.columns = [f"{question}: {label}" for label in table.iloc[label_rows, 0].astype(str)]
+        parts.append(shares.loc[:, ~shares.columns.duplicated()])
+    if not parts:
+        return pd.DataFrame({"category": []})
+    group_table = pd.concat(parts, axis=1)
+    group_table = group_table[~group_table.index.duplicated()]
+    return group_table.rename_axis("category").reset_index()
+
+
+def read_aggregated_source(folderpath, source) -> pd.DataFrame:
+    """
+    Reads an aggregated data source with the insurer join key and numeric value columns.
+    :param folderpath: The folder of the aggregated data files.
+    :param source: The name of the source, see AGGREGATED_SOURCES.
+    :return: The source table.
+    """
+    filename, sheet_name, keys, value_columns = AGGREGATED_SOURCES[source]
+    table = pd.read_excel(os.path.join(folderpath, filename), sheet_name=sheet_name)
+    table[value_columns] = table[value_columns].apply(pd.to_numeric, errors="coerce")
+    table["insurer_key"] = insurer_key(table["Krankenkasse"])
+    return table
+
+
+def regional_insurers(morbidity: pd.DataFrame) -> pd.DataFrame:
+    """
+    The regional AOK per Bundesland and year, from the 'Regionale Verteilung' of the morbidity data.
+    Bundesländer served by more than one AOK are left out.
+    :param morbidity: The morbidity data.
+    :return: The table with the columns 'Bundesland', 'Jahr' and 'insurer_key'.
+    """
+    aoks = morbidity[morbidity["Krankenkasse"].astype(str).str.startswith("AOK ")]
+    regions = aoks.assign(Bundesland=aoks["Regionale Verteilung"].astype(str).str.split(",")).explode("Bundesland")
+    regions["Bundesland"] = regions["Bundesland"].str.strip()
+    regions = regions[["Bundesland", "Jahr", "insurer_key"]]
+    return regions[~regions.duplicated(["Bundesland", "Jahr"], keep=False)]
+
+
+def read_survey_result(filepath):
+    """
+    Reads the respondents of a survey file and decodes the answers needed for the join.
+    :param filepath: The filepath of the survey excel file (sheets 'Result' and 'Codebook').
+    :return: The Result sheet with the added columns 'Jahr', 'Quartal', 'Bundesland' and 'insurer'.
+    """
+    result = pd.read_excel(filepath, sheet_name="Result")
+    labels = read_codebook_labels(pd.read_excel(filepath, sheet_name="Codebook"))
+    end = pd.to_datetime(result["End"], format="%d.%m.%Y - %H:%M", errors="coerce")
+    # the detailed insurer (Q10) of respondents answering "Andere Krankenasse"
+    insurer = pd.Series(decode_answers(result["Q9"], labels["Q9"]), index=result.index).astype(object)
+    other_insurer = pd.Series(decode_answers(result["Q10"], labels["Q10"]), index=result.index).astype(object)
+    is_other = pd.to_numeric(result["Q9"], errors="coerce").eq(OTHER_INSURER_ANSWER)
+    decoded = pd.DataFrame({"Jahr": end.dt.year,
+                            "Quartal": end.dt.quarter,
+                            "Geschlecht": decode_answers(result["Q1"], labels["Q1"]),
+                            "Bundesland": decode_answers(result["Q4"], labels["Q4"]),
+                            "insurer_group": insurer,
+                            "insurer": insurer.where(~is_other, other_insurer)}, index=result.index)
+    return pd.concat([result, decoded], axis=1)
+
+
+def combine_survey_and_aggregated_data(result: pd.DataFrame, folderpath_band, folderpath_aggregated) -> pd.DataFrame:
+    """
+    Enriches the respondents with the aggregated data: the answer shares of the Band questions of their
+    Geschlecht, Alter, Bundesland and Krankenkasse group, and the market share, morbidity and Zusatzbeitrag of their
+    Krankenkasse in the year (and quarter) of the survey. All joins are hash joins on categorical keys,
+    so the respondents of several survey waves can be enriched at once.
+    :param result: The respondents, see read_survey_result.
+    :param folderpath_band: The folder of the Band question tables.
+    :param folderpath_aggregated: The folder of the aggregated data files.
+    :return: The respondents with the joined columns.
+    """
+    registry = build_question_column_registry(folderpath_band)
+    groups = list(COLUMN_MAPPING.values())
+    question_tables = read_question_tables(
+        folderpath_band, sorted({q for group in groups for q in registry.questions_with_column(group)}))
 
-    print(sorted(clean_column_set))
-    print(column_number_answers)
+    # the Band categories of every respondent
+    band_keys = pd.DataFrame(index=result.index)
+    band_keys["Geschlecht"] = result["Geschlecht"].astype(object)
+    bundesland = result["Bundesland"].astype(object)
+    band_keys["Bundesländer"] = bundesland.map(BAND_STATES).fillna(bundesland)
+    band_keys["Gesetzliche Krankenkasse"] = result["insurer_group"].map(BAND_INSURER_GROUPS).fillna("Sonstige GKV")
+    band_keys.loc[result["insurer_group"].isna(), "Gesetzliche Krankenkasse"] = np.nan
+    joined = []
+    for group in groups:
+        group_table = band_group_table(registry, question_tables, group)
+        if group == "Alter":
+            # the exact age (Q2) is binned into the age groups of the Band tables
+            band_keys["Alter"] = age_groups(result["Q2"], list(group_table["category"])).astype(object)
+        print(f"Joining {group_table.shape[1] - 1} Band answer shares by {group}")
+        columns = [c for c in group_table.columns if c != "category"]
+        joined.append(hash_join(band_keys, group_table, [group], ["category"], columns, prefix=f"{group} | "))
 
+    # the regional AOK of respondents answering "AOK"
+    sources = {source: read_aggregated_source(folderpath_aggregated, source) for source in AGGREGATED_SOURCES}
+    insurer_keys = pd.DataFrame({"insurer_key": insurer_key(result["insurer"]),
+                                 "Bundesland": result["Bundesland"].astype(object),
+                                 "Jahr": result["Jahr"],
+                                 "Quartal": result["Quartal"]}, index=result.index)
+    regional = hash_join(insurer_keys, regional_insurers(sources["Morbidity"]), ["Bundesland", "Jahr"],
+                         ["Bundesland", "Jahr"], ["insurer_key"])["insurer_key"]
+    is_aok = insurer_keys["insurer_key"].eq(insurer_key(pd.Series(["AOK"])).iloc[0]).fillna(False)
+    insurer_keys.loc[is_aok & regional.notna(), "insurer_key"] = regional
+    joined.append(insurer_keys[["insurer_key"]])
 
-# def combine_survey_and_aggregated_data():
-#     # The question number mapping
-#     question_mapping = {
-#         "Q1": 106,
-#         "Q3": 107,
-#         "Q4":
-#     }
-#
-#     column_mapping = {
-#         "Q1": 'Geschlecht',
-#         "Q3": "Alter",
-#         "Q4": "Bundesländer",
-#     }
+    for source, (_, _, keys, value_columns) in AGGREGATED_SOURCES.items():
+        print(f"Joining {source} by Krankenkasse and {', '.join(keys)}")
+        source_columns = hash_join(insurer_keys, sources[source], ["insurer_key"] + keys, ["insurer_key"] + keys,
+                                   value_columns, prefix=f"{source} | ")
+        print(f"Matched {source_columns.iloc[:, -1].notna().sum()} of {len(result)} respondents")
+        joined.append(source_columns)
+    return pd.concat([result] + joined, axis=1)
 
 
 if __name__ == '__main__':
-    get_question_columns("../formatted_data/Kundenmonitor_GKV_2023/Band")
\ No newline at end of file
+    get_question_columns("../formatted_data/Kundenmonitor_GKV_2023/Band")
+    respondents = read_survey_result("../provided_data/230807_Survey.xlsx")
+    enriched_respondents = combine_survey_and_aggregated_data(respondents, "../formatted_data/Kundenmonitor_GKV_2023/Band",
+                                                              "../provided_data")
+    print(enriched_respondents.shape)
+    enriched_respondents.to_csv("../formatted_data/Kundenmonitor_GKV_2023/enriched_respondents.csv", index=False)
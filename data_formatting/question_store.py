@@ -0,0 +1,152 @@
+import csv
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+CATALOG_FILE = "catalog.json"
+
+
+def csv_column_names(header) -> list:
+    """
+    The column names pd.read_csv gives a CSV header row: duplicates are numbered and empty names are replaced
+    ('Alter', 'Alter.1', 'Unnamed: 0'). All readers of question tables name their columns with this function.
+    :param header: The cells of the header row.
+    :return: The column names.
+    """
+    header = ["" if cell is None or (isinstance(cell, float) and np.isnan(cell)) else cell for cell in header]
+    if not header:
+        return []
+    line = io.StringIO()
+    csv.writer(line).writerow(header)
+    line.seek(0)
+    return [str(c) for c in pd.read_csv(line, nrows=0).columns]
+
+
+def split_cells(table: pd.DataFrame):
+    """
+    Splits the cells of a table into a numeric matrix (NaN for text and empty cells) and the text cells.
+    :param table: The table.
+    :return: The float64 values, the (row, column) positions of the text cells and their texts.
+    """
+    cells = table.to_numpy(dtype=object)
+    is_text = np.vectorize(lambda value: isinstance(value, str), otypes=[bool])(cells) if cells.size else \
+        np.zeros(cells.shape, dtype=bool)
+    numbers = np.where(is_text, np.nan, cells)
+    values = pd.DataFrame(numbers).apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+    positions = np.argwhere(is_text).astype(np.int32)
+    texts = np.array([cells[r, c] for r, c in positions], dtype=str)
+    return values, positions, texts
+
+
+def save_question_table(table: pd.DataFrame, folder_path: str, name: str, question: str) -> dict:
+    """
+    Saves a question table as memory-mappable arrays: values.npy (float64, NaN for text cells),
+    text_positions.npy and text_values.npy for the text cells.
+    :param table: The question table.
+    :param folder_path: The folder of the store.
+    :param name: The name of the question table (e.g. Question_1).
+    :param question: The question text.
+    :return: The catalog entry of the question.
+    """
+    question_path = os.path.join(folder_path, name)
+    os.makedirs(question_path, exist_ok=True)
+    values, positions, texts = split_cells(table)
+    np.save(os.path.join(question_path, "values.npy"), values)
+    np.save(os.path.join(question_path, "text_positions.npy"), positions)
+    np.save(os.path.join(question_path, "text_values.npy"), texts)
+
+    text_columns = set(positions[:, 1].tolist())
+    return {"name": name,
+            "number": int(name.split("_")[1]),
+            "question": question,
+            "columns": csv_column_names(list(table.columns)),
+            "dtypes": ["object" if i in text_columns else "float64" for i in range(table.shape[1])],
+            "rows": int(table.shape[0])}
+
+
+def save_question_catalog(entries: list, folder_path: str):
+    """
+    Saves the catalog of a question store.
+    :param entries: The catalog entries of the questions, see save_question_table.
+    :param folder_path: The folder of the store.
+    """
+    os.makedirs(folder_path, exist_ok=True)
+    with open(os.path.join(folder_path, CATALOG_FILE), "w", encoding="utf-8") as f:
+        json.dump(sorted(entries, key=lambda entry: entry["number"]), f, ensure_ascii=False)
+
+
+def has_question_store(folder_path) -> bool:
+    """
+    Checks if a folder contains a question store.
+    :param folder_path: The folder.
+    :return: True if there is a catalog in the folder.
+    """
+    return os.path.exists(os.path.join(folder_path, CATALOG_FILE))
+
+
+class QuestionTableStore:
+    def __init__(self, folder_path):
+        """
+        Read access to a question store. The catalog answers schema questions without touching the tables,
+        the values of a table are memory-mapped.
+        :param folder_path: The folder of the store.
+        """
+        self.folder_path = folder_path
+        with open(os.path.join(folder_path, CATALOG_FILE), encoding="utf-8") as f:
+            self.catalog = {entry["number"]: entry for entry in json.load(f)}
+
+    def __contains__(self, number):
+        return number in self.catalog
+
+    def __iter__(self):
+        return iter(sorted(self.catalog))
+
+    def __len__(self):
+        return len(self.catalog)
+
+    def schema(self, number) -> dict:
+        """
+        The catalog entry (name, question, columns, dtypes, rows) of a question.
+        """
+        return self.catalog[number]
+
+    def values(self, number) -> np.ndarray:
+        """
+        The memory-mapped float64 values of a question table, NaN for text cells.
+        """
+        return np.load(os.path.join(self.folder_path, self.catalog[number]["name"], "values.npy"), mmap_mode="r")
+
+    def texts(self, number):
+        """
+        The (row, column) positions and texts of the text cells of a question table.
+        """
+        question_path = os.path.join(self.folder_path, self.catalog[number]["name"])
+        return np.load(os.path.join(question_path, "text_positions.npy")), \
+            np.load(os.path.join(question_path, "text_values.npy"))
+
+    def table(self, number) -> pd.DataFrame:
+        """
+        The question table as a DataFrame with the columns of its CSV file.
+        """
+        entry = self.catalog[number]
+        values = np.asarray(self.values(number))
+        positions, texts = self.texts(number)
+        cells = values.astype(object)
+        cells[np.isnan(values)] = np.nan
+        if len(positions):
+            cells[positions[:, 0], positions[:, 1]] = texts
+        table = pd.DataFrame(cells, columns=entry["columns"])
+        float_columns = [c for c, dtype in zip(entry["columns"], entry["dtypes"]) if dtype == "float64"]
+        return table.astype({c: np.float64 for c in float_columns})
+
+
+def load_question_store(folder_path) -> QuestionTableStore:
+    """
+    Opens the question store in a folder.
+    :param folder_path: The folder of the store.
+    :return: The store.
+    """
+    return QuestionTableStore(folder_path)
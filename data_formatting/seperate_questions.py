@@ -1,95 +1,129 @@
 import os.path
 
 import numpy as np
+import openpyxl
 import pandas as pd
 from numpy.ma.core import shape
 
+from data_formatting.question_store import save_question_catalog, save_question_table
 
 # from slugify import slugify
 
 
-def create_table_per_question(filepath_data, sheet_name, folder_path_questions):
+def iter_sheet_rows(filepath_data, sheet_name):
+    """
+    Streams the rows of a sheet of an excel file, read in openpyxl's read-only mode.
+    :param filepath_data: The filepath of the excel file.
+    :param sheet_name: The name of the sheet in the excel file.
+    :return: A generator of the rows as lists of cell values, empty cells and empty strings are None.
+    """
+    workbook = openpyxl.load_workbook(filepath_data, read_only=True, data_only=True)
+    try:
+        for row in workbook[sheet_name].iter_rows(values_only=True):
+            yield [None if value == "" else value for value in row]
+    finally:
+        workbook.close()
+
+
+def split_question_blocks(rows):
+    """
+    Splits the rows of a sheet into question and table blocks with a small state machine over the blank rows.
+    A block preceded by at least two blank rows (or the start of the sheet) is a question, it is emitted at its
+    first blank row. A block followed by two blank rows is a table, it is emitted at the second blank row.
+    The last block of the sheet is a table as well if it is not a question.
+    :param rows: The rows of the sheet, as lists of cell values.
+    :return: A generator of ("question", rows) and ("table", rows) tuples.
+    """
+    # the start of the sheet counts as two blank rows
+    blank_rows = 2
+    block = []
+    blank_rows_before_block = 0
+    for row in rows:
+        if all(value is None for value in row):
+            blank_rows += 1
+            if blank_rows == 1 and block and blank_rows_before_block >= 2:
+                yield "question", block
+            elif blank_rows == 2 and block:
+                yield "table", block
+                block = []
+            continue
+
+        if blank_rows > 0:
+            # a new block starts, a block followed by a single blank row is no table
+            block = []
+            blank_rows_before_block = blank_rows
+        block.append(row)
+        blank_rows = 0
+
+    if block and blank_rows < 2 and blank_rows_before_block < 2:
+        yield "table", block
+
+
+def combine_question_tables(tables):
+    """
+    Combines the tables of a question into one table.
+    :param tables: The tables of the question, the first row of each table is its header.
+    :return: The question table.
+    """
+    tables = [table if i == 0 else table.iloc[:, 2:] for i, table in enumerate(tables)]
+    question_table = pd.concat(tables, axis=1)
+    question_table.columns = question_table.iloc[0]
+    return question_table.iloc[1:, :]
+
+
+def create_table_per_question(filepath_data, sheet_name, folder_path_questions, output_format="csv"):
     """
     Creates tables for each question of a sheet  of an excel file and saves them in a folder.
+    The sheet is streamed row by row, every question table is saved as soon as the next question starts.
     :param filepath_data: The filepath of the excel file containing the data.
     :param sheet_name: The name of the sheet in the excel file.
     :param folder_path_questions: The folder path containing the resulting question tables.
+    :param output_format: "csv" for a Question_<n>.csv per question, "store" for a question store with a catalog
+    in the subfolder "store" (see question_store), "both" for both.
     """
-    table =pd.read_excel(filepath_data, sheet_name=sheet_name, header=None)
-    # print(table)
-
-    #get indicies of nan rows
-    nan_rows = table.isna().all(axis=1)
-    nan_rows = nan_rows.where(cond=(nan_rows==True)).dropna()
-    # print(nan_rows)
-
-    #init question_tables dict
-    question_tables = dict()
-
-    # read tables
-    last_index=-1
-    second_last_index=-2
-    current_question=""
-
-    for i in range(len(nan_rows)):
-        if last_index != nan_rows.index[i] -1 and second_last_index == last_index -1:
-            # read question
-            question_raw = table.iloc[last_index+1:nan_rows.index[i],:]
-
-            if current_question != question_to_string(question_raw):
-                # New question gets added to the dictionary
-                current_question = question_to_string(question_raw)
-                question_tables[current_question] = []
-
-            # print(question_to_string(question_raw))
-            # print(question_raw)
-
-
-        elif last_index == nan_rows.index[i] -1:
-            table.iloc[second_last_index+1,:].ffill(inplace=True)
-            # add table to question list
-            question_tables[current_question].append(pd.DataFrame(table.iloc[second_last_index+1:last_index, :])
-                                                     .reset_index(drop=True))
-            # print("table")
-
-        # update indices
-        second_last_index = last_index
-        last_index = nan_rows.index[i]
-
-    # combine tables for each question
-    for question in question_tables.keys():
-        for i in range(len(question_tables[question])):
-            if i != 0:
-                # remove duplicate columns
-                question_tables[question][i] = question_tables[question][i].iloc[:, 2:]
-
-        # concat question tables to one big question table
-        question_tables[question] = pd.concat(question_tables[question], axis=1)
-        question_tables[question].columns = question_tables[question].iloc[0]
-        question_tables[question] = question_tables[question].iloc[1:, :]
-
-    # save table for each question
+    if output_format not in ("csv", "store", "both"):
+        raise ValueError(f"Unknown output format {output_format}, use 'csv', 'store' or 'both'")
     if not os.path.exists(folder_path_questions):
         os.makedirs(folder_path_questions)
-
-    i = 1
-    question_list = []
-    for question in question_tables.keys():
-        # filename = slugify(question)
-        # if len(filename) > 250:
-        #     filename = filename[:250]
-        filename = "Question_" + str(i)
-        question_list.append(filename)
-        question_tables[question].to_csv(os.path.join(folder_path_questions, filename + ".csv"), index=False)
-        i+=1
-
-    # questions = np.empty(shape=(len(question_list),2))
-    # questions[:,0] = question_list
-    # questions[:,1] = question_tables.keys()
-    # write questions table
-    question_table =pd.DataFrame({"Question Nr":question_list,"Question": question_tables.keys() },
-                                 columns=["Question Nr","Question"])
+    folder_path_store = os.path.join(folder_path_questions, "store")
+
+    # question string -> question number, in order of appearance
+    question_numbers = dict()
+    current_question = None
+    current_tables = []
+    catalog = []
+
+    def save_question():
+        if current_question is not None and current_tables:
+            filename = "Question_" + str(question_numbers[current_question])
+            question_table = combine_question_tables(current_tables)
+            if output_format in ("csv", "both"):
+                question_table.to_csv(os.path.join(folder_path_questions, filename + ".csv"), index=False)
+            if output_format in ("store", "both"):
+                catalog.append(save_question_table(question_table, folder_path_store, filename, current_question))
+
+    for kind, block in split_question_blocks(iter_sheet_rows(filepath_data, sheet_name)):
+        if kind == "question":
+            question = question_to_string(pd.DataFrame(block))
+            if question != current_question:
+                # the previous question is complete
+                save_question()
+                current_question = question
+                current_tables = []
+                question_numbers.setdefault(question, len(question_numbers) + 1)
+        elif current_question is not None:
+            table = pd.DataFrame(block)
+            # fill the column categories of the header row into their merged cells
+            table.iloc[0] = table.iloc[0].ffill()
+            current_tables.append(table)
+    save_question()
+
+    question_table = pd.DataFrame({"Question Nr": ["Question_" + str(i) for i in question_numbers.values()],
+                                   "Question": question_numbers.keys()},
+                                  columns=["Question Nr", "Question"])
     question_table.to_csv(os.path.join(folder_path_questions, "question_table.csv"), index=False)
+    if output_format in ("store", "both"):
+        save_question_catalog(catalog, folder_path_store)
 
 
 def question_to_string(question_table: pd.DataFrame) -> str:
@@ -112,11 +146,14 @@ def find_faulty_tables(folder_path):
     :param folder_path: The folder path to the question tables.
     """
     for file in os.listdir(folder_path):
+        if not file.endswith(".csv"):
+            continue
         df = pd.read_csv(os.path.join(folder_path, file))
         if file != "question_table.csv" and df.columns[1] != "Gesamt":
             print("faulty table: " + file)
 
 
 if __name__ == '__main__':
-    create_table_per_question("provided_data/Kundenmonitor_GKV_2023.xlsx", "Band", "formatted_data/Kundenmonitor_GKV_2023/Band")
+    create_table_per_question("provided_data/Kundenmonitor_GKV_2023.xlsx", "Band", "formatted_data/Kundenmonitor_GKV_2023/Band",
+                              output_format="both")
     find_faulty_tables("formatted_data/Kundenmonitor_GKV_2023/Band")
\ No newline at end of file
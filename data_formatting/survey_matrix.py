@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+# smallest first, the first type whose range holds all codes is used
+INTEGER_TYPES = (np.int8, np.int16, np.int32, np.int64)
+
+
+def classify_columns(table: DataFrame):
+    """
+    Splits the columns of a survey table into numeric and string columns by their dtype.
+    Only object columns are checked further: they count as numeric if every value converts to a number.
+    :param table: The survey table.
+    :return: The numeric column names and the string column names, in table order.
+    """
+    object_columns = [c for c in table.columns
+                      if not pd.api.types.is_numeric_dtype(table[c]) and not pd.api.types.is_bool_dtype(table[c])]
+    string_columns = set()
+    if object_columns:
+        objects = table[object_columns]
+        converted = objects.apply(pd.to_numeric, errors="coerce")
+        has_text = (converted.isna() & objects.notna()).any()
+        string_columns = set(has_text.index[has_text.to_numpy()])
+
+    numeric = [c for c in table.columns if c not in string_columns]
+    strings = [c for c in table.columns if c in string_columns]
+    return numeric, strings
+
+
+def compact_integer_type(matrix: np.ndarray):
+    """
+    Smallest integer type that holds all values of the matrix.
+    :param matrix: The integer values.
+    :return: The numpy integer type.
+    """
+    if matrix.size == 0:
+        return INTEGER_TYPES[0]
+    low, high = matrix.min(), matrix.max()
+    for integer_type in INTEGER_TYPES:
+        info = np.iinfo(integer_type)
+        if info.min <= low and high <= info.max:
+            return integer_type
+    return np.int64
+
+
+def build_survey_matrix(table: DataFrame, fill_value: int = 0):
+    """
+    Converts the numeric columns of a survey table into one compact integer matrix.
+    String columns are dropped, missing answers are set to fill_value and values are truncated to integers.
+    :param table: The survey table.
+    :param fill_value: The value of missing answers.
+    :return: The matrix (int8/int16/... as the code range allows) and the list of its column names.
+    """
+    numeric, _ = classify_columns(table)
+    values = table[numeric].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    values = np.nan_to_num(values, nan=fill_value, posinf=fill_value, neginf=fill_value)
+    matrix = np.trunc(values).astype(np.int64)
+    return matrix.astype(compact_integer_type(matrix)), numeric
+
+
+def integer_codes(matrix: np.ndarray):
+    """
+    Encodes every column of a matrix as the integer codes 0..k-1 of its values.
+    :param matrix: The matrix, shape (samples, columns).
+    :return: The codes and the number of different values per column.
+    """
+    codes = np.empty(matrix.shape, dtype=np.int64)
+    cardinalities = np.empty(matrix.shape[1], dtype=np.int64)
+    for j in range(matrix.shape[1]):
+        values, codes[:, j] = np.unique(matrix[:, j], return_inverse=True)
+        cardinalities[j] = len(values)
+    return codes, cardinalities
@@ -0,0 +1,77 @@
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from data_formatting.combine_survey_data_with_aggregated_data import age_groups, hash_join
+from data_formatting.question_store import csv_column_names, load_question_store
+from data_formatting.seperate_questions import create_table_per_question, split_question_blocks
+
+
+def band_sheet_rows():
+    """
+    Two questions of a Band sheet, the first one continued in a second table under the repeated question
+    """
+    return [
+        ["Frage 1"], [None],
+        [None, "Gesamt", "Geschlecht", None], [None, None, "Männlich", "Weiblich"], ["Ja", 60.5, 55, 66], [None], [None],
+        ["Frage 1"], [None],
+        [None, "Gesamt", "Alter", None], [None, None, "16-29 Jahre", "30-39 Jahre"], ["Ja", 60.5, "-", 70],
+        [None], [None],
+        ["Frage 2"], [None],
+        [None, "Gesamt", "Geschlecht", None], [None, None, "Männlich", "Weiblich"], ["Nein", 39.5, 45, 34],
+    ]
+
+
+def test_split_question_blocks():
+    blocks = list(split_question_blocks(band_sheet_rows()))
+    assert [kind for kind, _ in blocks] == ["question", "table", "question", "table", "question", "table"]
+    assert blocks[0][1] == [["Frage 1"]]
+    assert blocks[3][1][2] == ["Ja", 60.5, "-", 70]
+
+
+def test_create_table_per_question_csv_and_store_agree(tmp_path):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Band"
+    for row in band_sheet_rows():
+        sheet.append(row)
+    workbook.save(tmp_path / "band.xlsx")
+
+    create_table_per_question(tmp_path / "band.xlsx", "Band", tmp_path / "questions", output_format="both")
+    store = load_question_store(tmp_path / "questions" / "store")
+    assert list(store) == [1, 2]
+    for number in store:
+        csv_table = pd.read_csv(tmp_path / "questions" / f"Question_{number}.csv")
+        store_table = store.table(number)
+        assert list(store_table.columns) == list(csv_table.columns)
+        # CSV cells of mixed columns are read as text ('55' for 55.0), compare numbers and texts separately
+        store_numbers = store_table.apply(pd.to_numeric, errors="coerce")
+        csv_numbers = csv_table.apply(pd.to_numeric, errors="coerce")
+        pd.testing.assert_frame_equal(store_numbers, csv_numbers, check_dtype=False)
+        pd.testing.assert_frame_equal(store_table.where(store_numbers.isna()).astype(str),
+                                      csv_table.where(csv_numbers.isna()).astype(str))
+    assert list(store.table(1).columns) == ["Unnamed: 0", "Gesamt", "Geschlecht", "Geschlecht.1", "Alter", "Alter.1"]
+
+
+def test_csv_column_names():
+    assert csv_column_names([None, "Alter", "Alter", ""]) == ["Unnamed: 0", "Alter", "Alter.1", "Unnamed: 3"]
+
+
+def test_hash_join_matches_merge():
+    left = pd.DataFrame({"Geschlecht": ["Männlich", "Weiblich", None, "Divers", "Weiblich"],
+                         "Jahr": [2023, 2023, 2023, 2023, 2024]}, index=[10, 11, 12, 13, 14])
+    right = pd.DataFrame({"category": ["Weiblich", "Männlich", "Weiblich", "Weiblich"],
+                          "Jahr": [2023, 2023, 2023, 2024], "share": [0.6, 0.4, 0.9, 0.7]})
+    joined = hash_join(left, right, ["Geschlecht", "Jahr"], ["category", "Jahr"], ["share"], prefix="band | ")
+
+    # of duplicated right keys the first row is used
+    expected = left.merge(right.drop_duplicates(["category", "Jahr"]), how="left",
+                          left_on=["Geschlecht", "Jahr"], right_on=["category", "Jahr"])["share"]
+    assert list(joined.columns) == ["band | share"]
+    assert list(joined.index) == list(left.index)
+    np.testing.assert_array_equal(joined["band | share"].to_numpy(), expected.to_numpy())
+
+
+def test_age_groups():
+    groups = age_groups(pd.Series([16, 29, 30, 75, 12]), ["30-39 Jahre", "16-29 Jahre", "70+ Jahre"])
+    assert list(groups.astype(object)) == ["16-29 Jahre", "16-29 Jahre", "30-39 Jahre", "70+ Jahre", np.nan]
@@ -0,0 +1,55 @@
+import numpy as np
+
+from mining_engines import mine_frequent_itemsets
+
+
+def hoeffding_epsilon(n_samples, delta=0.05):
+    """
+    Half width of the Hoeffding confidence interval of a relative support estimated from n_samples transactions:
+    with probability at least 1 - delta the true support is within the sample support +- epsilon
+    """
+    return float(np.sqrt(np.log(2 / delta) / (2 * n_samples)))
+
+
+def approximate_frequent_itemsets(transactions, min_support=0.1, max_len=3, engine="eclat", item_groups=None,
+                                  sample_fraction=0.2, delta=0.05, verify_top=None, seed=None):
+    """
+    Mine the frequent itemsets on a random sample of the transactions (respondents).
+    The sample is mined at min_support - epsilon, so itemsets whose true support reaches min_support are only
+    missed with probability delta. Every itemset gets the Hoeffding bounds support_lower and support_upper
+    (per itemset, not simultaneous over all itemsets).
+    'support' is always the sample support, so rule confidence and lift are computed from one consistent source
+    and stay approximate. With verify_top, the verify_top itemsets with the highest sample support are counted
+    exactly in one pass over the full bitset matrix: the exact support goes to 'support_exact', their bounds collapse
+    to it and 'verified' is set.
+    Returns the frequent itemsets with 'support', 'itemsets', 'support_lower', 'support_upper', 'support_exact'
+    (NaN if not verified) and 'verified'
+    """
+    rng = np.random.default_rng(seed)
+    n_samples = max(int(round(sample_fraction * transactions.n_transactions)), 1)
+    sample = transactions.select_transactions(np.sort(rng.choice(transactions.n_transactions, n_samples,
+                                                                 replace=False)))
+    epsilon = hoeffding_epsilon(n_samples, delta)
+    print(f"Mining a sample of {n_samples} of {transactions.n_transactions} transactions, "
+          f"support bounds +-{epsilon * 100:.2f}%")
+
+    frequent_itemsets = mine_frequent_itemsets(sample,
+                                               min_support=max(min_support - epsilon, 1 / n_samples),
+                                               max_len=max_len,
+                                               engine=engine,
+                                               item_groups=item_groups)
+    frequent_itemsets["support_lower"] = (frequent_itemsets["support"] - epsilon).clip(lower=0)
+    frequent_itemsets["support_upper"] = (frequent_itemsets["support"] + epsilon).clip(upper=1)
+    frequent_itemsets["support_exact"] = np.nan
+    frequent_itemsets["verified"] = False
+
+    if verify_top:
+        top = frequent_itemsets["support"].nlargest(verify_top).index
+        exact = [transactions.support([transactions.item_index[item] for item in itemset])
+                 for itemset in frequent_itemsets.loc[top, "itemsets"]]
+        frequent_itemsets.loc[top, ["support_exact", "support_lower", "support_upper"]] = np.repeat(
+            np.array(exact)[:, None], 3, axis=1)
+        frequent_itemsets.loc[top, "verified"] = True
+        print(f"Verified the top {len(top)} itemsets on all transactions")
+
+    return frequent_itemsets
@@ -0,0 +1,154 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from data_formatting.survey_matrix import classify_columns
+
+# Number of set bits for every possible byte value
+POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(bits):
+    """
+    Count the set bits of a packed bitset (or of every row of a 2D array of bitsets)
+    """
+    return POPCOUNT_TABLE[bits].sum(axis=-1, dtype=np.int64)
+
+
+def item_question(item):
+    """
+    Get the question an item belongs to, e.g. 'Q8.1_2' -> 'Q8' and 'Q91_Alter' -> 'Q91'
+    """
+    return item.split('_', 1)[0].split('.')[0]
+
+
+class BitmapTransactions:
+    def __init__(self, items, bits, n_transactions):
+        """
+        Respondent x item transaction matrix stored as one packed bitset per item.
+        :param items: The item names, one per bitset.
+        :param bits: uint8 array of shape (n_items, ceil(n_transactions / 8)), row i is the bitset of item i.
+        :param n_transactions: The number of transactions (respondents).
+        """
+        self.items = list(items)
+        self.bits = np.ascontiguousarray(bits, dtype=np.uint8)
+        self.n_transactions = int(n_transactions)
+        self.item_index = {item: i for i, item in enumerate(self.items)}
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def shape(self):
+        return self.n_transactions, len(self.items)
+
+    def tidset(self, item_indices):
+        """
+        AND the bitsets of the given items into the bitset of transactions containing all of them
+        """
+        item_indices = list(item_indices)
+        if not item_indices:
+            # all transactions, with the padding bits of the last byte cleared
+            return np.packbits(np.ones(self.n_transactions, dtype=bool))
+        return np.bitwise_and.reduce(self.bits[item_indices], axis=0)
+
+    def count(self, item_indices):
+        """
+        Number of transactions containing all of the given items
+        """
+        return int(popcount(self.tidset(item_indices)))
+
+    def support(self, item_indices):
+        """
+        Relative support of the itemset made of the given items
+        """
+        return self.count(item_indices) / self.n_transactions
+
+    def item_supports(self):
+        """
+        Relative support of every single item
+        """
+        return popcount(self.bits) / self.n_transactions
+
+    def item_questions(self):
+        """
+        Question label of every item
+        """
+        return [item_question(item) for item in self.items]
+
+    def select_items(self, item_indices):
+        """
+        Transaction matrix with only the given items, in the given order
+        """
+        item_indices = list(item_indices)
+        return BitmapTransactions([self.items[i] for i in item_indices], self.bits[item_indices], self.n_transactions)
+
+    def slice_transactions(self, start, stop=None):
+        """
+        Transaction matrix with only the transactions start:stop
+        """
+        stop = self.n_transactions if stop is None else stop
+        return self.select_transactions(np.arange(start, stop))
+
+    def select_transactions(self, transaction_indices):
+        """
+        Transaction matrix with only the given transactions, in the given order
+        """
+        dense = np.unpackbits(self.bits, axis=1, count=self.n_transactions)[:, transaction_indices]
+        return BitmapTransactions(self.items, np.packbits(dense, axis=1), dense.shape[1])
+
+    def to_dataframe(self):
+        """
+        Unpack the bitsets into a boolean transactions x items DataFrame (the format mlxtend expects)
+        """
+        dense = np.unpackbits(self.bits, axis=1, count=self.n_transactions).astype(bool)
+        return pd.DataFrame(dense.T, columns=self.items)
+
+    @classmethod
+    def from_dataframe(cls, data):
+        """
+        Pack a boolean transactions x items DataFrame into bitsets
+        """
+        dense = data.to_numpy(dtype=bool)
+        return cls(data.columns, np.packbits(dense.T, axis=1), dense.shape[0])
+
+
+def format_answer(value):
+    """
+    Format an answer code for an item name, dropping the '.0' of integral codes
+    """
+    return str(int(value)) if float(value).is_integer() else str(value)
+
+
+def prepare_respondent_transactions(survey_path, sheet_name="Result", max_answers=20, ignore_values=(0,)):
+    """
+    Build a respondent x item transaction matrix from the Result sheet of the survey.
+    Every answer code of a question column becomes one item 'Q<num>_<answer>'. Free text columns and
+    columns with more than max_answers different codes (number inputs like the age) are skipped,
+    ignore_values are treated as 'not selected' and produce no item.
+    """
+    print(f"\nLoading respondent data from {survey_path} ({sheet_name})...")
+    table = pd.read_excel(survey_path, sheet_name=sheet_name)
+    question_columns = [c for c in table.columns if re.fullmatch(r"Q\d+(\.\d+)*", str(c))]
+    # free text columns are skipped
+    numeric_columns, _ = classify_columns(table[question_columns])
+
+    items = []
+    bitsets = []
+    for column in numeric_columns:
+        values = pd.to_numeric(table[column], errors="coerce").to_numpy(dtype=float)
+        valid = ~np.isnan(values) & ~np.isin(values, ignore_values)
+        answers = np.unique(values[valid])
+        if len(answers) == 0 or len(answers) > max_answers:
+            continue
+
+        # one-hot encode all answers of the column at once and pack them into bitsets
+        one_hot = values[None, :] == answers[:, None]
+        bitsets.append(np.packbits(one_hot, axis=1))
+        items.extend(f"{column}_{format_answer(answer)}" for answer in answers)
+
+    bits = np.vstack(bitsets) if bitsets else np.zeros((0, (len(table) + 7) // 8), dtype=np.uint8)
+    transactions = BitmapTransactions(items, bits, len(table))
+    print(f"Created transaction matrix with {transactions.n_transactions} respondents and {len(transactions)} items")
+    return transactions
@@ -2,24 +2,52 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 import ast
+import hashlib
+from collections import OrderedDict
+
+from bitmap_transactions import item_question
+from rule_store import PatternStore, load_pattern_store, save_pattern_store
+
+from data_formatting.question_store import has_question_store, load_question_store
 
 def load_pattern_results():
     """
-    Load the pattern mining results from the CSV files
+    Load the pattern mining results, from the memory-mapped pattern stores if present, otherwise from the CSV files
     """
     results_dir = Path("pattern_mining/results")
+    if (results_dir / "association_rules" / "store.json").exists():
+        rules = load_pattern_store(results_dir / "association_rules")
+        itemsets = load_pattern_store(results_dir / "frequent_itemsets")
+        return rules, itemsets
     rules = pd.read_csv(results_dir / "association_rules.csv")
     itemsets = pd.read_csv(results_dir / "frequent_itemsets.csv")
     return rules, itemsets
 
-def parse_pattern(pattern_str):
+def iter_rules(rules):
+    """
+    Iterate over the rules as (antecedents, consequents, support, confidence, lift)
+    """
+    if isinstance(rules, PatternStore):
+        support, confidence, lift = (rules.metrics[c] for c in ("support", "confidence", "lift"))
+        for row in range(len(rules)):
+            yield (rules.itemset("antecedents", row), rules.itemset("consequents", row),
+                   float(support[row]), float(confidence[row]), float(lift[row]))
+    else:
+        for _, rule in rules.iterrows():
+            yield rule['antecedents'], rule['consequents'], rule['support'], rule['confidence'], rule['lift']
+
+def parse_pattern(pattern):
     """
-    Parse a pattern string into a list of (question_num, category) tuples
+    Parse a pattern (list of item names or a frozenset string from the CSV results)
+    into a list of (question_num, category) tuples, sub-question items ('Q20.1_3') belong to their question
     """
-    # Remove frozenset and split into individual items
-    pattern_str = pattern_str.replace("frozenset({", "").replace("})", "")
-    items = pattern_str.split("', '")
-    items = [item.strip("'") for item in items]
+    if isinstance(pattern, str):
+        # Remove frozenset and split into individual items
+        pattern = pattern.replace("frozenset({", "").replace("})", "")
+        items = pattern.split("', '")
+        items = [item.strip("'") for item in items]
+    else:
+        items = list(pattern)
     
     # Parse each item into question number and category
     parsed_items = []
@@ -27,61 +55,190 @@ def parse_pattern(pattern_str):
         if item.startswith("Q"):
             parts = item.split("_", 1)
             if len(parts) == 2:
-                question_num = int(parts[0][1:])
+                question_num = int(item_question(item)[1:])
                 category = parts[1]
                 parsed_items.append((question_num, category))
     
     return parsed_items
 
-def load_question_data(question_num):
+class QuestionStore:
+    def __init__(self, data_dir="formatted_data/Kundenmonitor_GKV_2023/Band", cache_dir="pattern_mining/cache/questions",
+                 max_bytes=256 * 2 ** 20):
+        """
+        Lazy access to the question tables: a table is only read when it is first asked for,
+        kept in an LRU cache of at most max_bytes and parsed from a binary cache keyed by the file hash
+        when the CSV has been parsed before. If data_dir has a question store (data_dir/store), the tables
+        are read from its memory-mapped arrays instead and no CSV is parsed.
+        :param data_dir: The folder with the Question_<n>.csv files.
+        :param cache_dir: The folder of the pre-parsed binary tables, None to always parse the CSV.
+        :param max_bytes: The memory bound of the LRU cache.
+        """
+        self.data_dir = Path(data_dir)
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.max_bytes = max_bytes
+        self.question_store = None
+        if has_question_store(self.data_dir / "store"):
+            self.question_store = load_question_store(self.data_dir / "store")
+            self.files = {question_num: None for question_num in self.question_store}
+        else:
+            self.files = {int(f.stem.split('_')[1]): f for f in self.data_dir.glob('Question_*.csv')}
+        self.tables = OrderedDict()
+        self.table_bytes = {}
+
+    def __contains__(self, question_num):
+        return question_num in self.files
+
+    def __iter__(self):
+        return iter(sorted(self.files))
+
+    def __len__(self):
+        return len(self.files)
+
+    def read_table(self, question_num):
+        """
+        Read a question table from the question store or the binary cache,
+        parsing and caching the CSV if its hash is not cached yet
+        """
+        if self.question_store is not None:
+            return self.question_store.table(question_num)
+
+        file = self.files[question_num]
+        if self.cache_dir is None:
+            return pd.read_csv(file)
+
+        file_hash = hashlib.sha1(file.read_bytes()).hexdigest()
+        cache_file = self.cache_dir / f"{file.stem}.{file_hash}.pkl"
+        if cache_file.exists():
+            return pd.read_pickle(cache_file)
+
+        df = pd.read_csv(file)
+        self.cache_dir.mkdir(exist_ok=True, parents=True)
+        for stale in self.cache_dir.glob(f"{file.stem}.*.pkl"):
+            stale.unlink()
+        df.to_pickle(cache_file)
+        return df
+
+    def __getitem__(self, question_num):
+        if question_num in self.tables:
+            self.tables.move_to_end(question_num)
+            return self.tables[question_num]
+
+        df = self.read_table(question_num)
+        self.tables[question_num] = df
+        self.table_bytes[question_num] = int(df.memory_usage(deep=True).sum())
+        # evict the least recently used tables, but always keep the one just read
+        while sum(self.table_bytes.values()) > self.max_bytes and len(self.tables) > 1:
+            evicted, _ = self.tables.popitem(last=False)
+            del self.table_bytes[evicted]
+        return df
+
+class InvertedIndex:
+    def __init__(self, question_data):
+        """
+        Inverted index from (question, column) to the packed bitmap of the rows with a positive value.
+        The rows are those of the first question table, like in the original set intersection.
+        The bitmaps of a question are built the first time a pattern refers to it.
+        :param question_data: The question tables by question number (dict or QuestionStore).
+        """
+        self.question_data = question_data
+        self.n_rows = len(question_data[next(iter(question_data))]) if len(question_data) > 0 else 0
+        self.columns = {}
+        self.bitmaps = {}
+        # columns of a question matching a category, resolved once per (question, category)
+        self.resolved = {}
+
+    def question_bitmaps(self, question_num):
+        """
+        Packed row bitmaps of all columns of a question, built on first use
+        """
+        if question_num not in self.bitmaps:
+            df = self.question_data[question_num]
+            values = df.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+            present = np.zeros((self.n_rows, df.shape[1]), dtype=bool)
+            n = min(self.n_rows, len(df))
+            present[:n] = values[:n] > 0
+            self.columns[question_num] = [str(col) for col in df.columns]
+            self.bitmaps[question_num] = np.packbits(present, axis=0)
+        return self.bitmaps[question_num]
+
+    def matching_columns(self, question_num, category):
+        """
+        Positions of the columns of a question whose name contains the category
+        """
+        key = (question_num, category)
+        if key not in self.resolved:
+            self.question_bitmaps(question_num)
+            self.resolved[key] = [i for i, col in enumerate(self.columns[question_num]) if category in col]
+        return self.resolved[key]
+
+    def match(self, pattern):
+        """
+        Sorted row indices matching all (question_num, category) items of a pattern, as a bitmap AND
+        """
+        matching = np.packbits(np.ones(self.n_rows, dtype=bool))
+        for question_num, category in pattern:
+            if question_num not in self.question_data:
+                continue
+            columns = self.matching_columns(question_num, category)
+            if columns:
+                matching = matching & np.bitwise_and.reduce(self.question_bitmaps(question_num)[:, columns], axis=1)
+        return np.flatnonzero(np.unpackbits(matching, count=self.n_rows))
+
+def find_matching_data_points(pattern, index):
     """
-    Load data for a specific question
+    Find data points that match a given pattern, as a sorted array of row indices
     """
-    data_path = Path(f"formatted_data/Kundenmonitor_GKV_2023/Band/Question_{question_num}.csv")
-    if not data_path.exists():
-        return None
-    
-    df = pd.read_csv(data_path)
-    return df
+    if index.n_rows == 0:
+        return np.empty(0, dtype=np.int64)
+    return index.match(pattern)
 
-def find_matching_data_points(pattern, question_data_dict):
+def pattern_items(pattern):
     """
-    Find data points that match a given pattern
+    Item names ('Q<num>_<category>') of a parsed pattern
     """
-    if not question_data_dict:
-        return []
-        
-    # Initialize with all indices from the first dataframe
-    first_df = next(iter(question_data_dict.values()))
-    matching_indices = set(range(len(first_df)))
-    
-    for question_num, category in pattern:
-        if question_num not in question_data_dict:
-            continue
-            
-        df = question_data_dict[question_num]
-        # Find the column that matches the category
-        matching_cols = [col for col in df.columns if category in col]
-        if not matching_cols:
-            continue
-            
-        # Get indices where the category is present
-        for col in matching_cols:
-            # Convert column to numeric if possible, otherwise treat as string
-            try:
-                col_values = pd.to_numeric(df[col], errors='coerce')
-                col_indices = set(df[~col_values.isna() & (col_values > 0)].index)
-            except:
-                # If conversion fails, treat as string and check for non-empty values
-                col_indices = set(df[df[col].notna() & (df[col] != '')].index)
-            
-            matching_indices = matching_indices.intersection(col_indices)
-    
-    return list(matching_indices)
+    return [f"Q{question_num}_{category}" for question_num, category in pattern]
 
-def format_for_causal_testing():
+def save_causal_testing_data(patterns, offsets, indices, path):
     """
-    Main function to format pattern mining results for causal independence testing
+    Save the causal testing data normalised: a pattern store with one row per pattern and its metrics
+    plus a CSR index, the data points of pattern i are indices[offsets[i]:offsets[i + 1]]
+    """
+    path = Path(path)
+    save_pattern_store(patterns, path, ["antecedents", "consequents"], ["support", "confidence", "lift"])
+    np.save(path / "matches.offsets.npy", offsets)
+    np.save(path / "matches.indices.npy", indices)
+
+def load_causal_testing_data(path):
+    """
+    Open the causal testing data: the memory-mapped pattern store and the CSR offsets and data point indices
+    """
+    path = Path(path)
+    patterns = load_pattern_store(path)
+    offsets = np.load(path / "matches.offsets.npy", mmap_mode="r")
+    indices = np.load(path / "matches.indices.npy", mmap_mode="r")
+    return patterns, offsets, indices
+
+def expand_causal_testing_data(patterns, offsets, indices):
+    """
+    Expand the normalised data to the old one-row-per-data-point table, column by column
+    """
+    counts = np.diff(offsets)
+    parsed = [(str(parse_pattern(a)), str(parse_pattern(c))) for a, c in zip(patterns['antecedents'], patterns['consequents'])]
+    return pd.DataFrame({
+        'pattern_id': np.repeat([f"pattern_{i}" for i in range(len(patterns))], counts),
+        'antecedent_pattern': np.repeat([a for a, _ in parsed], counts),
+        'consequent_pattern': np.repeat([c for _, c in parsed], counts),
+        'data_point_index': indices,
+        'support': np.repeat(patterns['support'].to_numpy(), counts),
+        'confidence': np.repeat(patterns['confidence'].to_numpy(), counts),
+        'lift': np.repeat(patterns['lift'].to_numpy(), counts),
+    })
+
+def format_for_causal_testing(legacy_csv=False):
+    """
+    Main function to format pattern mining results for causal independence testing.
+    Writes causal_testing_data/ (pattern table + pattern -> data point CSR index),
+    with legacy_csv also the expanded causal_testing_data.csv
     """
     print("Loading pattern mining results...")
     rules, itemsets = load_pattern_results()
@@ -90,57 +247,57 @@ def format_for_causal_testing():
     output_dir = Path("pattern_mining/causal_testing")
     output_dir.mkdir(exist_ok=True, parents=True)
     
-    # Load all question data
-    print("Loading question data...")
-    question_data_dict = {}
-    for question_num in range(1, 200):  # Adjust range based on your data
-        df = load_question_data(question_num)
-        if df is not None:
-            question_data_dict[question_num] = df
+    # Question tables are only loaded when a rule refers to them
+    question_store = QuestionStore()
+    print(f"Found {len(question_store)} question files")
+    index = InvertedIndex(question_store)
     
     # Process each rule
     print("Processing patterns for causal testing...")
-    causal_testing_data = []
+    patterns = {'antecedents': [], 'consequents': [], 'support': [], 'confidence': [], 'lift': []}
+    matches = []
     
-    for _, rule in rules.iterrows():
+    for antecedents, consequents, support, confidence, lift in iter_rules(rules):
         try:
             # Parse antecedent and consequent patterns
-            antecedent_pattern = parse_pattern(rule['antecedents'])
-            consequent_pattern = parse_pattern(rule['consequents'])
+            antecedent_pattern = parse_pattern(antecedents)
+            consequent_pattern = parse_pattern(consequents)
             
             if not antecedent_pattern or not consequent_pattern:
                 continue
             
             # Find matching data points
-            matching_indices = find_matching_data_points(antecedent_pattern, question_data_dict)
+            matching_indices = find_matching_data_points(antecedent_pattern, index)
             
-            if not matching_indices:
+            if len(matching_indices) == 0:
                 continue
             
-            # Create a record for causal testing
-            for idx in matching_indices:
-                record = {
-                    'pattern_id': f"pattern_{len(causal_testing_data)}",
-                    'antecedent_pattern': str(antecedent_pattern),
-                    'consequent_pattern': str(consequent_pattern),
-                    'data_point_index': idx,
-                    'support': rule['support'],
-                    'confidence': rule['confidence'],
-                    'lift': rule['lift']
-                }
-                causal_testing_data.append(record)
+            # One row per pattern, the data points go into the CSR index
+            patterns['antecedents'].append(pattern_items(antecedent_pattern))
+            patterns['consequents'].append(pattern_items(consequent_pattern))
+            patterns['support'].append(support)
+            patterns['confidence'].append(confidence)
+            patterns['lift'].append(lift)
+            matches.append(matching_indices.astype(np.int32))
         except Exception as e:
-            print(f"Error processing rule: {rule['antecedents']} -> {rule['consequents']}")
+            print(f"Error processing rule: {antecedents} -> {consequents}")
             print(f"Error details: {str(e)}")
             continue
     
-    # Convert to DataFrame and save
-    if causal_testing_data:
-        df = pd.DataFrame(causal_testing_data)
-        df.to_csv(output_dir / "causal_testing_data.csv", index=False)
-        print(f"Saved {len(df)} patterns for causal testing")
+    # Save the pattern table and the pattern -> data point index
+    if matches:
+        patterns = pd.DataFrame(patterns)
+        offsets = np.zeros(len(matches) + 1, dtype=np.int64)
+        np.cumsum([len(m) for m in matches], out=offsets[1:])
+        indices = np.concatenate(matches)
+        save_causal_testing_data(patterns, offsets, indices, output_dir / "causal_testing_data")
+        print(f"Saved {len(patterns)} patterns with {len(indices)} data points for causal testing")
+
+        if legacy_csv:
+            expand_causal_testing_data(patterns, offsets, indices).to_csv(output_dir / "causal_testing_data.csv",
+                                                                          index=False)
     else:
         print("No patterns found for causal testing")
 
 if __name__ == "__main__":
-    format_for_causal_testing() 
\ No newline at end of file
+    format_for_causal_testing()
@@ -0,0 +1,169 @@
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+
+from bitmap_transactions import BitmapTransactions, popcount
+from mining_engines import eclat, itemsets_to_dataframe, minimum_count, question_groups
+
+
+def question_hashes(transactions, n_transactions=None):
+    """
+    Content hash per question over the item names and bitsets of its items.
+    With n_transactions only the first n_transactions transactions are hashed, items without any
+    transaction in that range are left out, so answers that first appear in a new wave don't change the hash.
+    """
+    if n_transactions is not None and n_transactions != transactions.n_transactions:
+        transactions = transactions.slice_transactions(0, n_transactions)
+    counts = popcount(transactions.bits)
+
+    hashes = {}
+    for i, question in enumerate(transactions.item_questions()):
+        if counts[i] == 0:
+            continue
+        digest = hashes.setdefault(question, hashlib.sha1())
+        digest.update(transactions.items[i].encode("utf-8"))
+        digest.update(transactions.bits[i].tobytes())
+    return {question: digest.hexdigest() for question, digest in hashes.items()}
+
+
+class IncrementalMiner:
+    def __init__(self, state_dir, min_support=0.1, max_len=3, one_item_per_question=True):
+        """
+        Frequent itemset miner that persists its item bitsets and itemset counts between runs
+        and only recounts what a new survey wave or a changed question file affects.
+        :param state_dir: The folder the mining state is kept in.
+        :param min_support: The minimum relative support.
+        :param max_len: The maximum itemset length.
+        :param one_item_per_question: Never combine items of the same question.
+        """
+        self.state_dir = Path(state_dir)
+        self.parameters = {"min_support": min_support, "max_len": max_len,
+                           "one_item_per_question": one_item_per_question}
+
+    def item_groups(self, transactions):
+        if self.parameters["one_item_per_question"]:
+            return question_groups(transactions)
+        return np.arange(len(transactions))
+
+    def load_state(self):
+        """
+        Load the persisted transactions, question hashes and itemset counts, None if there is no usable state
+        """
+        if not (self.state_dir / "state.json").exists():
+            return None
+        with open(self.state_dir / "state.json") as f:
+            state = json.load(f)
+        if state["parameters"] != self.parameters:
+            return None
+
+        bitsets = np.load(self.state_dir / "bitsets.npz")
+        transactions = BitmapTransactions(bitsets["items"].tolist(), bitsets["bits"], state["n_transactions"])
+        itemsets = np.load(self.state_dir / "itemsets.npz")
+        offsets, ids, counts = itemsets["offsets"], itemsets["ids"], itemsets["counts"]
+        names = transactions.items
+        found = {tuple(names[i] for i in ids[offsets[row]:offsets[row + 1]]): int(counts[row])
+                 for row in range(len(counts))}
+        return transactions, state["question_hashes"], found
+
+    def save_state(self, transactions, hashes, found):
+        """
+        Persist the transactions, question hashes and the {item name tuple: count} itemset counts
+        """
+        self.state_dir.mkdir(exist_ok=True, parents=True)
+        np.savez(self.state_dir / "bitsets.npz", items=np.array(transactions.items, dtype=str), bits=transactions.bits)
+
+        item_ids = transactions.item_index
+        lengths = np.array([len(itemset) for itemset in found], dtype=np.int64)
+        offsets = np.zeros(len(found) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        ids = np.array([item_ids[item] for itemset in found for item in itemset], dtype=np.int32)
+        np.savez(self.state_dir / "itemsets.npz", offsets=offsets, ids=ids,
+                 counts=np.array(list(found.values()), dtype=np.int64))
+
+        with open(self.state_dir / "state.json", "w") as f:
+            json.dump({"parameters": self.parameters, "n_transactions": transactions.n_transactions,
+                       "question_hashes": hashes}, f)
+
+    def mine(self, transactions, roots=None):
+        """
+        Eclat over the transactions, returns {sorted item name tuple: count}
+        """
+        min_count = minimum_count(self.parameters["min_support"], transactions.n_transactions)
+        found = eclat(transactions, min_count, self.parameters["max_len"], self.item_groups(transactions), roots)
+        return {tuple(sorted(transactions.items[i] for i in itemset)): count for itemset, count in found.items()}
+
+    def update_questions(self, transactions, old_found, changed_questions):
+        """
+        Same respondents, some questions changed: keep the counts of itemsets without a changed item and
+        mine only the itemsets containing at least one item of a changed question
+        """
+        questions = transactions.item_questions()
+        changed = [i for i, q in enumerate(questions) if q in changed_questions]
+        unchanged = [i for i, q in enumerate(questions) if q not in changed_questions]
+
+        unchanged_set = set(unchanged)
+        found = {itemset: count for itemset, count in old_found.items()
+                 if all(transactions.item_index.get(item) in unchanged_set for item in itemset)}
+
+        # with the changed items first, every itemset containing one starts with a changed item
+        reordered = transactions.select_items(changed + unchanged)
+        found.update(self.mine(reordered, roots=range(len(changed))))
+        return found
+
+    def update_appended(self, transactions, old_transactions, old_found):
+        """
+        New respondents appended (FUP): update the old frequent itemsets with their counts in the increment,
+        an itemset that was infrequent before can only become frequent if it is frequent in the increment
+        """
+        n_old = old_transactions.n_transactions
+        increment = transactions.slice_transactions(n_old)
+        min_count = minimum_count(self.parameters["min_support"], transactions.n_transactions)
+
+        found = {}
+        for itemset, count in old_found.items():
+            indices = [transactions.item_index[item] for item in itemset]
+            count += increment.count(indices)
+            if count >= min_count:
+                found[itemset] = count
+
+        # candidates from the increment, counted over all transactions
+        for itemset in self.mine(increment):
+            if itemset in old_found:
+                continue
+            count = transactions.count([transactions.item_index[item] for item in itemset])
+            if count >= min_count:
+                found[itemset] = count
+        return found
+
+    def update(self, transactions):
+        """
+        Update the frequent itemsets with the current transactions and persist the new state.
+        Returns the frequent itemsets as a DataFrame with 'support' and 'itemsets' columns
+        """
+        hashes = question_hashes(transactions)
+        state = self.load_state()
+
+        if state is None:
+            print("No incremental mining state found, mining all questions")
+            found = self.mine(transactions)
+        else:
+            old_transactions, old_hashes, old_found = state
+            if old_transactions.n_transactions == transactions.n_transactions:
+                changed = {q for q in set(hashes) | set(old_hashes) if hashes.get(q) != old_hashes.get(q)}
+                print(f"Questions changed since the last run: {len(changed)}")
+                found = self.update_questions(transactions, old_found, changed) if changed else old_found
+            elif (old_transactions.n_transactions < transactions.n_transactions
+                  and question_hashes(transactions, old_transactions.n_transactions) == old_hashes):
+                print(f"{transactions.n_transactions - old_transactions.n_transactions} respondents appended, "
+                      f"updating the counts")
+                found = self.update_appended(transactions, old_transactions, old_found)
+            else:
+                print("Earlier respondents changed, mining all questions")
+                found = self.mine(transactions)
+
+        self.save_state(transactions, hashes, found)
+        index = transactions.item_index
+        return itemsets_to_dataframe({tuple(index[item] for item in itemset): count
+                                      for itemset, count in found.items()}, transactions)
@@ -0,0 +1,260 @@
+import numpy as np
+import pandas as pd
+
+from bitmap_transactions import popcount
+
+ENGINES = ("apriori", "fpgrowth", "eclat")
+
+ITEMSET_TYPES = ("all", "closed", "maximal")
+
+
+def question_groups(transactions):
+    """
+    Group ID per item, items of the same question share a group
+    """
+    question_ids = {}
+    return np.array([question_ids.setdefault(q, len(question_ids)) for q in transactions.item_questions()],
+                    dtype=np.int64)
+
+
+def minimum_count(min_support, n_transactions):
+    """
+    Smallest absolute count that reaches the relative minimum support
+    """
+    return max(int(np.ceil(min_support * n_transactions - 1e-9)), 1)
+
+
+def mine_frequent_itemsets(transactions, min_support=0.1, max_len=3, engine="apriori", item_groups=None):
+    """
+    Mine the frequent itemsets of a BitmapTransactions matrix with the chosen engine.
+    Items with the same entry in item_groups (e.g. the answers of one question) are never combined,
+    the constraint is applied during candidate generation so excluded itemsets are never counted.
+    Returns a DataFrame with 'support' and 'itemsets' (frozensets of item names) like mlxtend.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown mining engine: {engine}, expected one of {ENGINES}")
+    if max_len is None:
+        max_len = len(transactions)
+    if item_groups is None:
+        item_groups = np.arange(len(transactions))
+    item_groups = np.asarray(item_groups)
+
+    min_count = minimum_count(min_support, transactions.n_transactions)
+    if engine == "apriori":
+        found = apriori_bitset(transactions, min_count, max_len, item_groups)
+    elif engine == "fpgrowth":
+        found = fpgrowth(transactions, min_count, max_len, item_groups)
+    else:
+        found = eclat(transactions, min_count, max_len, item_groups)
+
+    return itemsets_to_dataframe(found, transactions)
+
+
+def itemsets_to_dataframe(found, transactions):
+    """
+    Convert {item index tuple: count} into the mlxtend frequent itemset format
+    """
+    return pd.DataFrame({
+        "support": np.array(list(found.values()), dtype=float) / transactions.n_transactions,
+        "itemsets": [frozenset(transactions.items[i] for i in itemset) for itemset in found.keys()],
+    }, columns=["support", "itemsets"])
+
+
+def filter_itemsets(frequent_itemsets, itemset_type="closed"):
+    """
+    Reduce the frequent itemsets to the closed (no superset with the same support) or the maximal
+    (no frequent superset) ones. Every itemset only has to be compared with its direct supersets,
+    so one pass over the (k+1)-itemsets marks all k-itemsets that are not closed or not maximal.
+    """
+    if itemset_type not in ITEMSET_TYPES:
+        raise ValueError(f"Unknown itemset type: {itemset_type}, expected one of {ITEMSET_TYPES}")
+    if itemset_type == "all":
+        return frequent_itemsets
+
+    supports = dict(zip(frequent_itemsets["itemsets"], frequent_itemsets["support"]))
+    covered = set()
+    for itemset, support in supports.items():
+        if len(itemset) < 2:
+            continue
+        for item in itemset:
+            subset = itemset - {item}
+            # supports are rounded the same way for all itemsets, equal counts give equal supports
+            if itemset_type == "maximal" or supports.get(subset) == support:
+                covered.add(subset)
+
+    keep = ~frequent_itemsets["itemsets"].isin(covered)
+    return frequent_itemsets[keep].reset_index(drop=True)
+
+
+def frequent_items(transactions, min_count):
+    """
+    Indices and counts of all single items reaching the minimum count
+    """
+    counts = popcount(transactions.bits)
+    indices = np.flatnonzero(counts >= min_count)
+    return indices, counts[indices]
+
+
+def apriori_bitset(transactions, min_count, max_len, item_groups):
+    """
+    Level-wise Apriori: joins itemsets sharing all but their last item and counts candidates by AND-ing tidsets
+    """
+    indices, counts = frequent_items(transactions, min_count)
+    found = {(int(i),): int(c) for i, c in zip(indices, counts)}
+    level = {(int(i),): transactions.bits[i] for i in indices}
+
+    k = 1
+    while level and k < max_len:
+        # group the sorted itemsets of this level by their (k-1)-prefix
+        by_prefix = {}
+        for itemset in sorted(level):
+            by_prefix.setdefault(itemset[:-1], []).append(itemset[-1])
+
+        next_level = {}
+        for prefix, last_items in by_prefix.items():
+            for a_pos, a in enumerate(last_items):
+                tids_a = level[prefix + (a,)]
+                for b in last_items[a_pos + 1:]:
+                    if item_groups[a] == item_groups[b]:
+                        continue
+                    candidate = prefix + (a, b)
+                    # every k-subset of a frequent candidate has to be frequent
+                    if any(candidate[:i] + candidate[i + 1:] not in level for i in range(k - 1)):
+                        continue
+                    tids = tids_a & transactions.bits[b]
+                    count = int(popcount(tids))
+                    if count >= min_count:
+                        next_level[candidate] = tids
+                        found[candidate] = count
+        level = next_level
+        k += 1
+
+    return found
+
+
+def eclat(transactions, min_count, max_len, item_groups, roots=None):
+    """
+    Vertical depth-first mining: every prefix keeps its tidset and the tidsets of its frequent extensions,
+    all extensions of a prefix are counted in one vectorized AND + popcount.
+    If roots is given, only itemsets whose first item (in item order) is one of the roots are mined.
+    """
+    indices, counts = frequent_items(transactions, min_count)
+    found = {}
+
+    def extend(prefix, extensions, extension_tids):
+        for pos, item in enumerate(extensions):
+            itemset = prefix + (item,)
+            tids = extension_tids[pos]
+            found[itemset] = int(popcount(tids))
+            if len(itemset) >= max_len or pos + 1 == len(extensions):
+                continue
+
+            others = extensions[pos + 1:]
+            allowed = item_groups[others] != item_groups[item]
+            others = others[allowed]
+            combined = extension_tids[pos + 1:][allowed] & tids
+            keep = popcount(combined) >= min_count
+            if keep.any():
+                extend(itemset, others[keep], combined[keep])
+
+    if roots is None:
+        extend((), indices, transactions.bits[indices])
+    else:
+        roots = set(int(r) for r in roots)
+        for pos, item in enumerate(indices):
+            if int(item) not in roots:
+                continue
+            # the root itself plus its extensions with the items after it
+            found[(int(item),)] = int(counts[pos])
+            if max_len < 2:
+                continue
+            others = indices[pos + 1:]
+            others = others[item_groups[others] != item_groups[item]]
+            combined = transactions.bits[others] & transactions.bits[item]
+            keep = popcount(combined) >= min_count
+            if keep.any():
+                extend((int(item),), others[keep], combined[keep])
+
+    return {tuple(int(i) for i in itemset): count for itemset, count in found.items()}
+
+
+class FPNode:
+    __slots__ = ("item", "count", "parent", "children", "link")
+
+    def __init__(self, item, parent):
+        self.item = item
+        self.count = 0
+        self.parent = parent
+        self.children = {}
+        self.link = None
+
+
+def build_fp_tree(weighted_paths, min_count, item_groups, excluded_groups):
+    """
+    Build an FP-tree from (items, count) paths, keeping only frequent items of allowed groups.
+    Returns the header table {item: first node} and the item counts.
+    """
+    item_counts = {}
+    for path, count in weighted_paths:
+        for item in path:
+            item_counts[item] = item_counts.get(item, 0) + count
+    item_counts = {item: count for item, count in item_counts.items()
+                   if count >= min_count and item_groups[item] not in excluded_groups}
+
+    root = FPNode(None, None)
+    header = {}
+    for path, count in weighted_paths:
+        # insert the frequent items in descending count order, so frequent prefixes are shared
+        ordered = sorted((item for item in path if item in item_counts), key=lambda i: (-item_counts[i], i))
+        node = root
+        for item in ordered:
+            child = node.children.get(item)
+            if child is None:
+                child = FPNode(item, node)
+                node.children[item] = child
+                child.link = header.get(item)
+                header[item] = child
+            child.count += count
+            node = child
+
+    return header, item_counts
+
+
+def fpgrowth(transactions, min_count, max_len, item_groups):
+    """
+    FP-growth: compresses the transactions into an FP-tree and mines it recursively over conditional pattern bases.
+    Items of a group already in the suffix are dropped from the conditional bases.
+    """
+    indices, _ = frequent_items(transactions, min_count)
+    dense = np.unpackbits(transactions.bits[indices], axis=1, count=transactions.n_transactions).T.astype(bool)
+    rows, columns = np.nonzero(dense)
+    split_points = np.searchsorted(rows, np.arange(1, transactions.n_transactions))
+    paths = [(indices[cols].tolist(), 1) for cols in np.split(columns, split_points) if len(cols) > 0]
+
+    found = {}
+
+    def mine(weighted_paths, suffix, suffix_groups):
+        header, item_counts = build_fp_tree(weighted_paths, min_count, item_groups, suffix_groups)
+        # least frequent items first, their conditional bases are the smallest
+        for item in sorted(header, key=lambda i: (item_counts[i], -i)):
+            itemset = suffix + (item,)
+            found[tuple(sorted(itemset))] = item_counts[item]
+            if len(itemset) >= max_len:
+                continue
+
+            conditional_paths = []
+            node = header[item]
+            while node is not None:
+                path = []
+                parent = node.parent
+                while parent.item is not None:
+                    path.append(parent.item)
+                    parent = parent.parent
+                if path:
+                    conditional_paths.append((path, node.count))
+                node = node.link
+            if conditional_paths:
+                mine(conditional_paths, itemset, suffix_groups | {item_groups[item]})
+
+    mine(paths, (), frozenset())
+    return found
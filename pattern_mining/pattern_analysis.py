@@ -1,60 +1,120 @@
 import pandas as pd
 import numpy as np
-from mlxtend.frequent_patterns import apriori, association_rules
 from sklearn.preprocessing import LabelEncoder
 import os
 from pathlib import Path
 from tqdm import tqdm
-import gc
+import csv
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from bitmap_transactions import BitmapTransactions, item_question, prepare_respondent_transactions
+from approximate_mining import approximate_frequent_itemsets
+from incremental_mining import IncrementalMiner
+from mining_engines import filter_itemsets, mine_frequent_itemsets, question_groups
+from rule_generation import top_k_rules, top_k_rules_parallel
+from rule_store import save_itemset_store, save_rule_store
+
+from data_formatting.question_store import csv_column_names, has_question_store, load_question_store
+
+def read_band_table(file):
+    """
+    Read only the header, the category row and the last row of a Band question CSV.
+    Returns the names of the answer columns (columns with a category) and their last-row values as float32
+    """
+    with open(file, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        categories = next(reader, None)
+        # the rows in between are parsed but not kept, quoted fields may span lines
+        last_row = None
+        for last_row in reader:
+            pass
+    if header is None or categories is None or last_row is None:
+        return [], np.empty(0, dtype=np.float32)
+
+    names = []
+    values = []
+    for col, cat, cell in list(zip(csv_column_names(header), categories, last_row))[1:]:  # Skip the first empty column
+        if not cat.strip():
+            continue
+        try:
+            value = float(cell)
+        except ValueError:
+            continue
+        if not np.isnan(value):
+            names.append(col)
+            values.append(value)
+    return names, np.array(values, dtype=np.float32)
+
+def read_band_store_table(store, question_num):
+    """
+    Same as read_band_table for a question of the question store: the names come from the catalog,
+    only the category row and the last row of the memory-mapped values are touched
+    """
+    entry = store.schema(question_num)
+    if entry["rows"] < 2:
+        return [], np.empty(0, dtype=np.float32)
+    values = store.values(question_num)
+    positions, texts = store.texts(question_num)
+    categories = ["" if np.isnan(value) else str(value) for value in values[0]]
+    last_row = values[-1].astype(np.float64)
+    for (row, col), text in zip(positions.tolist(), texts.tolist()):
+        if row == 0:
+            categories[col] = text
+        elif row == entry["rows"] - 1:
+            try:
+                last_row[col] = float(text)
+            except ValueError:
+                pass
+
+    names = []
+    row_values = []
+    for col, cat, value in list(zip(entry["columns"], categories, last_row))[1:]:  # Skip the first empty column
+        if cat.strip() and not np.isnan(value):
+            names.append(col)
+            row_values.append(value)
+    return names, np.array(row_values, dtype=np.float32)
+
+def load_band_tables(data_dir, max_workers=8):
+    """
+    Read all Band question CSV files concurrently, or the question store in data_dir/store if there is one.
+    Returns {question_num: (category_names, float32 values)} with the values of the last row per category column
+    """
+    if has_question_store(Path(data_dir) / "store"):
+        store = load_question_store(Path(data_dir) / "store")
+        print("\nLoading question tables from the question store")
+        return {question_num: read_band_store_table(store, question_num) for question_num in store}
+
+    question_files = [f for f in Path(data_dir).glob('Question_*.csv') if f.name.lower() != 'question_table.csv']
+    band_tables = {}
+
+    print("\nLoading and processing question files:")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(read_band_table, file): file for file in question_files}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Processing files"):
+            file = futures[future]
+            try:
+                band_tables[int(file.stem.split('_')[1])] = future.result()
+            except Exception as e:
+                print(f"\nError processing {file.name}: {str(e)}")
+
+    return band_tables
 
 def load_and_prepare_data(data_dir):
     """
     Load all question CSV files and prepare them for pattern mining
     """
     data_path = Path(data_dir)
-    all_data = {}
     
     # Load question table first
     question_table = pd.read_csv(data_path / 'question_table.csv')
     print(f"Loaded question table with shape: {question_table.shape}")
     
-    # Get list of all question files first
-    question_files = list(data_path.glob('Question_*.csv'))
-    question_files = [f for f in question_files if f.name.lower() != 'question_table.csv']
-    
-    # Load all question files with progress bar
-    print("\nLoading and processing question files:")
-    for file in tqdm(question_files, desc="Processing files"):
-        question_num = int(file.stem.split('_')[1])
-        try:
-            df = pd.read_csv(file)
-            
-            # Get the first row which contains the actual column names
-            column_names = df.columns.tolist()
-            
-            # Get the second row which contains the categories
-            if len(df) >= 2:
-                categories = df.iloc[0].tolist()
-                
-                # Create a dictionary of category values for this question
-                category_values = {}
-                for col, cat in zip(column_names[1:], categories[1:]):  # Skip the first empty column
-                    if pd.notna(cat) and str(cat).strip():
-                        try:
-                            value = float(df.iloc[-1][col])
-                            if not np.isnan(value):
-                                category_values[col] = value
-                        except (ValueError, TypeError):
-                            continue
-                
-                all_data[question_num] = category_values
-            
-            # Clean up memory
-            del df
-            gc.collect()
-            
-        except Exception as e:
-            print(f"\nError processing {file.name}: {str(e)}")
+    band_tables = load_band_tables(data_path)
+
+    # Create a dictionary of category values for every question
+    all_data = {question_num: dict(zip(names, values.tolist()))
+                for question_num, (names, values) in band_tables.items()}
     
     print(f"\nSuccessfully processed {len(all_data)} question files")
     return all_data, question_table
@@ -86,35 +146,85 @@ def prepare_for_pattern_mining(data_dict, min_support_value=10.0):
     
     return pattern_df
 
-def perform_pattern_mining(data, min_support=0.1, min_confidence=0.5):
+def perform_pattern_mining(data, min_support=0.1, min_confidence=0.5, engine="apriori", max_len=3,
+                           one_item_per_question=True, top_k=1000, rule_metric="lift", min_thresholds=None,
+                           n_jobs=1, incremental_state_dir=None, sample_fraction=None, verify_top=None,
+                           itemset_type="all"):
     """
-    Perform pattern mining using the Apriori algorithm
+    Perform pattern mining with the chosen engine ("apriori", "fpgrowth" or "eclat").
+    data is either a boolean transactions x items DataFrame or a BitmapTransactions matrix.
+    With one_item_per_question, items of the same question are never combined into one itemset.
+    Only the top_k rules by rule_metric are kept, min_thresholds adds minimum values for other metrics.
+    With n_jobs other than 1 the rules are generated on a process pool (None uses all CPUs).
+    With incremental_state_dir the frequent itemsets are updated from the state of the last run there,
+    only questions or respondents that changed since then are mined again.
+    With sample_fraction the itemsets are mined approximately on a random sample of the transactions, with
+    confidence bounds on every support; the verify_top itemsets are then counted exactly on all transactions
+    (support_exact), the rules are computed from the sample supports only.
+    itemset_type "closed" or "maximal" only returns the closed or maximal itemsets and derives the rules from them
     """
+    if not isinstance(data, BitmapTransactions):
+        data = BitmapTransactions.from_dataframe(data)
+
     print("\nStarting pattern mining...")
     print(f"Input data shape: {data.shape}")
     print(f"Using minimum support: {min_support*100}% and minimum confidence: {min_confidence*100}%")
     
     # Generate frequent itemsets
-    print("\nGenerating frequent itemsets...")
-    frequent_itemsets = apriori(data,
-                              min_support=min_support,
-                              use_colnames=True,
-                              max_len=3)  # Limit to patterns of at most 3 items
+    if incremental_state_dir is not None:
+        print(f"\nUpdating frequent itemsets incrementally from {incremental_state_dir}...")
+        miner = IncrementalMiner(incremental_state_dir, min_support=min_support, max_len=max_len,
+                                 one_item_per_question=one_item_per_question)
+        frequent_itemsets = miner.update(data)
+    elif sample_fraction is not None:
+        print(f"\nGenerating approximate frequent itemsets with {engine} on a {sample_fraction*100}% sample...")
+        frequent_itemsets = approximate_frequent_itemsets(data,
+                                                          min_support=min_support,
+                                                          max_len=max_len,
+                                                          engine=engine,
+                                                          item_groups=question_groups(data) if one_item_per_question else None,
+                                                          sample_fraction=sample_fraction,
+                                                          verify_top=verify_top)
+    else:
+        print(f"\nGenerating frequent itemsets with {engine}...")
+        item_groups = question_groups(data) if one_item_per_question else None
+        frequent_itemsets = mine_frequent_itemsets(data,
+                                                   min_support=min_support,
+                                                   max_len=max_len,  # Limit to patterns of at most max_len items
+                                                   engine=engine,
+                                                   item_groups=item_groups)
     
     print(f"Found {len(frequent_itemsets)} frequent itemsets")
+
+    # the rules are built from the reduced itemsets, but need the supports of all their subsets
+    reduced_itemsets = None
+    if itemset_type != "all":
+        reduced_itemsets = filter_itemsets(frequent_itemsets, itemset_type)
+        print(f"Reduced to {len(reduced_itemsets)} {itemset_type} itemsets")
     
     if len(frequent_itemsets) > 0:
         # Generate association rules
-        print("\nGenerating association rules...")
-        rules = association_rules(frequent_itemsets,
-                                metric="confidence",
-                                min_threshold=min_confidence)
+        print(f"\nGenerating top {top_k} association rules by {rule_metric}...")
+        thresholds = {"confidence": min_confidence, **(min_thresholds or {})}
+        if n_jobs == 1:
+            rules = top_k_rules(frequent_itemsets,
+                                k=top_k,
+                                metric=rule_metric,
+                                min_thresholds=thresholds,
+                                rule_itemsets=reduced_itemsets)
+        else:
+            rules = top_k_rules_parallel(frequent_itemsets,
+                                         k=top_k,
+                                         metric=rule_metric,
+                                         min_thresholds=thresholds,
+                                         rule_itemsets=reduced_itemsets,
+                                         n_jobs=n_jobs)
         
         print(f"Generated {len(rules)} association rules")
         
         # Add question numbers to the rules for better readability
         def extract_question_num(pattern_list):
-            return [int(p.split('_')[0].replace('Q', '')) for p in pattern_list]
+            return [int(item_question(p)[1:]) for p in pattern_list]
         
         if len(rules) > 0:
             print("\nProcessing rules...")
@@ -124,27 +234,41 @@ def perform_pattern_mining(data, min_support=0.1, min_confidence=0.5):
         rules = pd.DataFrame()
         print("No association rules could be generated")
     
+    if reduced_itemsets is not None:
+        frequent_itemsets = reduced_itemsets
     return frequent_itemsets, rules
 
-def analyze_patterns():
+def analyze_patterns(data_mode="band", survey_path="provided_data/230807_Survey.xlsx", data_dir=None,
+                     incremental=False):
     """
-    Main function to analyze patterns in the data
+    Main function to analyze patterns in the data.
+    data_mode "band" mines the aggregated Band question tables in data_dir, "respondent" mines the
+    respondent x answer transactions of the survey Result sheet.
+    With incremental, the mining state is kept in pattern_mining/state/<data_mode> and only new waves
+    or changed question files are mined again
     """
     print("Starting pattern analysis...")
     
     try:
-        # Load data
-        data_dir = "formatted_data/Kundenmonitor_GKV_2023/Band"
-        all_data, question_table = load_and_prepare_data(data_dir)
-        
-        # Prepare data for pattern mining with higher support threshold
-        prepared_data = prepare_for_pattern_mining(all_data, min_support_value=10.0)
+        if data_mode == "respondent":
+            # One transaction per respondent, stored as packed bitsets per answer item
+            prepared_data = prepare_respondent_transactions(survey_path, sheet_name="Result")
+        elif data_mode == "band":
+            # Load data
+            data_dir = data_dir or "formatted_data/Kundenmonitor_GKV_2023/Band"
+            all_data, question_table = load_and_prepare_data(data_dir)
+
+            # Prepare data for pattern mining with higher support threshold
+            prepared_data = prepare_for_pattern_mining(all_data, min_support_value=10.0)
+        else:
+            raise ValueError(f"Unknown data mode: {data_mode}")
         
         # Perform pattern mining with higher thresholds
         frequent_itemsets, rules = perform_pattern_mining(
             prepared_data,
             min_support=0.1,  # 10% minimum support
-            min_confidence=0.6  # 60% minimum confidence
+            min_confidence=0.6,  # 60% minimum confidence
+            incremental_state_dir=Path("pattern_mining/state") / data_mode if incremental else None
         )
         
         # Save results
@@ -161,6 +285,9 @@ def analyze_patterns():
             # Save top 1000 frequent itemsets
             frequent_itemsets.head(1000).to_csv(output_dir / "frequent_itemsets.csv")
             print(f"\nSaved top 1000 frequent itemsets")
+
+            # Save all frequent itemsets in the memory-mappable store
+            save_itemset_store(frequent_itemsets, output_dir / "frequent_itemsets")
             
             if len(rules) > 0:
                 # Add percentage columns for better interpretability
@@ -170,6 +297,7 @@ def analyze_patterns():
                 # Sort rules by lift and take top 1000
                 rules = rules.sort_values('lift', ascending=False)
                 rules.head(1000).to_csv(output_dir / "association_rules.csv")
+                save_rule_store(rules, output_dir / "association_rules")
                 print(f"Saved top 1000 association rules")
                 
                 # Print top 10 rules by lift
@@ -0,0 +1,296 @@
+import heapq
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+METRICS = ("lift", "confidence", "conviction", "leverage")
+
+RULE_COLUMNS = ["antecedents", "consequents", "antecedent support", "consequent support",
+                "support", "confidence", "lift", "leverage", "conviction"]
+
+
+def rule_metrics(support, antecedent_support, consequent_support):
+    """
+    Compute the rule metrics of antecedent -> consequent from the three supports
+    """
+    confidence = support / antecedent_support
+    lift = confidence / consequent_support
+    leverage = support - antecedent_support * consequent_support
+    conviction = np.inf if confidence >= 1 else (1 - consequent_support) / (1 - confidence)
+    return {"confidence": confidence, "lift": lift, "leverage": leverage, "conviction": conviction}
+
+
+def iter_rules(frequent_itemsets, rule_itemsets=None):
+    """
+    Stream all rules antecedent -> consequent that can be built from the frequent itemsets
+    (or only from rule_itemsets, e.g. the closed ones, with the supports still looked up in all frequent itemsets).
+    Yields (antecedent, consequent, support, antecedent support, consequent support)
+    """
+    supports = dict(zip(frequent_itemsets["itemsets"], frequent_itemsets["support"]))
+    if rule_itemsets is None:
+        rule_itemsets = frequent_itemsets
+    for itemset, support in zip(rule_itemsets["itemsets"], rule_itemsets["support"]):
+        if len(itemset) < 2:
+            continue
+        items = sorted(itemset)
+        for size in range(1, len(items)):
+            for antecedent in combinations(items, size):
+                antecedent = frozenset(antecedent)
+                consequent = itemset - antecedent
+                yield antecedent, consequent, support, supports[antecedent], supports[consequent]
+
+
+def top_k_rules(frequent_itemsets, k=1000, metric="lift", min_thresholds=None, rule_itemsets=None):
+    """
+    Generate the k best association rules by the chosen metric without materialising all rules.
+    Candidate rules are streamed from the frequent itemsets and kept in a bounded min-heap of size k.
+    :param frequent_itemsets: DataFrame with 'support' and 'itemsets' columns (all subsets of an itemset included).
+    :param k: The number of rules to keep.
+    :param metric: The metric to rank the rules by, one of METRICS.
+    :param min_thresholds: Optional minimum value per metric, e.g. {"confidence": 0.6}.
+    :param rule_itemsets: Optional subset of the frequent itemsets (e.g. the closed ones) to build the rules from.
+    :return: DataFrame with the top k rules, sorted by the metric in descending order.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown rule metric: {metric}, expected one of {METRICS}")
+    min_thresholds = min_thresholds or {}
+    for name in min_thresholds:
+        if name not in METRICS:
+            raise ValueError(f"Unknown rule metric: {name}, expected one of {METRICS}")
+
+    heap = []
+    # tie breaker, so the heap never has to compare frozensets
+    counter = 0
+    for antecedent, consequent, support, antecedent_support, consequent_support in iter_rules(frequent_itemsets, rule_itemsets):
+        metrics = rule_metrics(support, antecedent_support, consequent_support)
+        if any(metrics[name] < threshold for name, threshold in min_thresholds.items()):
+            continue
+
+        score = metrics[metric]
+        if len(heap) == k and score <= heap[0][0]:
+            continue
+        entry = (score, counter, antecedent, consequent, antecedent_support, consequent_support, support, metrics)
+        counter += 1
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        else:
+            heapq.heapreplace(heap, entry)
+
+    rows = []
+    for _, _, antecedent, consequent, antecedent_support, consequent_support, support, metrics in sorted(heap, reverse=True):
+        rows.append([antecedent, consequent, antecedent_support, consequent_support, support,
+                     metrics["confidence"], metrics["lift"], metrics["leverage"], metrics["conviction"]])
+    return pd.DataFrame(rows, columns=RULE_COLUMNS)
+
+
+def encode_itemsets(frequent_itemsets):
+    """
+    Intern the items to integer IDs and encode every itemset as a sorted, -1 padded ID row
+    and as a single sortable key (see itemset_keys), so supports can be looked up vectorized.
+    Returns the item names, the ID matrix, the sizes and the keys.
+    """
+    items = sorted(set().union(*frequent_itemsets["itemsets"]))
+    item_ids = {item: i for i, item in enumerate(items)}
+    max_len = max(len(itemset) for itemset in frequent_itemsets["itemsets"])
+
+    ids = np.full((len(frequent_itemsets), max_len), -1, dtype=np.int64)
+    for row, itemset in enumerate(frequent_itemsets["itemsets"]):
+        encoded = sorted(item_ids[item] for item in itemset)
+        ids[row, :len(encoded)] = encoded
+    sizes = (ids >= 0).sum(axis=1)
+    return items, ids, sizes, itemset_keys(ids, len(items) + 1)
+
+
+def itemset_keys(ids, base):
+    """
+    Encode sorted, -1 padded item ID rows as int64 keys (mixed radix over the item IDs), padding contributes nothing
+    to the key. If the keys of base ** width could overflow int64, the rows are encoded as fixed-width byte strings
+    instead, which sort and search the same way, only slower
+    """
+    if base ** ids.shape[1] < 2 ** 63:
+        weights = base ** np.arange(ids.shape[1], dtype=np.int64)
+        return ((ids + 1) * weights).sum(axis=1)
+    rows = np.ascontiguousarray(ids + 1, dtype=">i8")
+    return rows.view(np.dtype((np.void, rows.itemsize * ids.shape[1]))).ravel()
+
+
+def to_shared_memory(array):
+    """
+    Copy an array into a new shared memory block, returns the block and its (name, shape, dtype) description
+    """
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+
+# Arrays of the support table, attached once per worker process
+_shared_blocks = []
+_shared_tables = {}
+
+
+def attach_shared_tables(descriptions):
+    """
+    Process pool initializer: attach the shared support table instead of pickling it to every task
+    """
+    for name, (block_name, shape, dtype) in descriptions.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        _shared_blocks.append(block)
+        _shared_tables[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+
+def build_support_table(frequent_itemsets, rule_itemsets=None):
+    """
+    Build the sorted support table of the frequent itemsets: item ID rows, int64 keys and supports sorted by key,
+    plus 'rows_by_size', the rows to build rules from (all, or those of rule_itemsets) grouped by itemset size.
+    Returns the item names, the tables and {size: (first, last)} ranges into rows_by_size
+    """
+    items, ids, sizes, keys = encode_itemsets(frequent_itemsets)
+    order = np.argsort(keys)
+    rule_rows = np.arange(len(order))
+    if rule_itemsets is not None:
+        rule_rows = np.flatnonzero(frequent_itemsets["itemsets"].isin(set(rule_itemsets["itemsets"])).to_numpy()[order])
+    rows_by_size = rule_rows[np.argsort(sizes[order][rule_rows], kind="stable")]
+    tables = {"ids": ids[order], "keys": keys[order],
+              "supports": frequent_itemsets["support"].to_numpy(dtype=np.float64)[order],
+              "rows_by_size": rows_by_size}
+
+    sorted_sizes = sizes[order][rows_by_size]
+    size_ranges = {}
+    for size in range(2, ids.shape[1] + 1):
+        first, last = np.searchsorted(sorted_sizes, [size, size + 1])
+        if last > first:
+            size_ranges[size] = (int(first), int(last))
+    return items, tables, size_ranges
+
+
+def itemset_rule_metrics(tables, rows, size, base, min_thresholds=None):
+    """
+    Compute all rules of the size-sized itemsets at rows of a support table with vectorized lookups.
+    Returns arrays of the itemset rows, the antecedent bit masks (bit i set: i-th item is in the antecedent),
+    the supports and the metrics of the rules reaching min_thresholds
+    """
+    ids = tables["ids"]
+    keys = tables["keys"]
+    supports = tables["supports"]
+    itemset_ids = ids[rows, :size]
+    support = supports[rows]
+
+    def lookup(columns):
+        sub_ids = np.full((len(rows), ids.shape[1]), -1, dtype=np.int64)
+        sub_ids[:, :len(columns)] = itemset_ids[:, columns]
+        return supports[np.searchsorted(keys, itemset_keys(sub_ids, base))]
+
+    results = {name: [] for name in ("rows", "masks", "antecedent support", "consequent support", "support",
+                                     "confidence", "lift", "leverage", "conviction")}
+    for mask in range(1, 2 ** size - 1):
+        antecedent = [i for i in range(size) if mask >> i & 1]
+        consequent = [i for i in range(size) if not mask >> i & 1]
+        antecedent_support = lookup(antecedent)
+        consequent_support = lookup(consequent)
+
+        confidence = support / antecedent_support
+        lift = confidence / consequent_support
+        leverage = support - antecedent_support * consequent_support
+        with np.errstate(divide="ignore", invalid="ignore"):
+            conviction = np.where(confidence >= 1, np.inf, (1 - consequent_support) / (1 - confidence))
+        metrics = {"confidence": confidence, "lift": lift, "leverage": leverage, "conviction": conviction}
+
+        keep = np.ones(len(rows), dtype=bool)
+        for name, threshold in (min_thresholds or {}).items():
+            keep &= metrics[name] >= threshold
+        results["rows"].append(rows[keep])
+        results["masks"].append(np.full(keep.sum(), mask, dtype=np.int64))
+        results["antecedent support"].append(antecedent_support[keep])
+        results["consequent support"].append(consequent_support[keep])
+        results["support"].append(support[keep])
+        for name, values in metrics.items():
+            results[name].append(values[keep])
+
+    return {name: np.concatenate(values) for name, values in results.items()}
+
+
+def shard_top_k_rules(size, start, stop, base, k, metric, min_thresholds):
+    """
+    Compute all rules of the size-sized itemsets start:stop of the shared table with vectorized lookups
+    and return the k best of them as (itemset rows, antecedent masks, metric arrays)
+    """
+    rows = _shared_tables["rows_by_size"][start:stop]
+    return select_top_k(itemset_rule_metrics(_shared_tables, rows, size, base, min_thresholds), k, metric)
+
+
+def select_top_k(results, k, metric):
+    """
+    Keep the k entries of the result arrays with the highest metric
+    """
+    if len(results[metric]) > k:
+        best = np.argpartition(-results[metric], k - 1)[:k]
+        results = {name: values[best] for name, values in results.items()}
+    return results
+
+
+def decode_rules(items, tables, results, ranking):
+    """
+    Turn the rule arrays of itemset_rule_metrics into a rules DataFrame, in the order of ranking
+    """
+    rows = []
+    for i in ranking:
+        itemset = [items[item] for item in tables["ids"][results["rows"][i]] if item >= 0]
+        mask = results["masks"][i]
+        antecedent = frozenset(item for pos, item in enumerate(itemset) if mask >> pos & 1)
+        consequent = frozenset(itemset) - antecedent
+        rows.append([antecedent, consequent, results["antecedent support"][i], results["consequent support"][i],
+                     results["support"][i], results["confidence"][i], results["lift"][i],
+                     results["leverage"][i], results["conviction"][i]])
+    return pd.DataFrame(rows, columns=RULE_COLUMNS)
+
+
+def top_k_rules_parallel(frequent_itemsets, k=1000, metric="lift", min_thresholds=None, rule_itemsets=None,
+                         n_jobs=None, shard_size=4096):
+    """
+    Generate the k best association rules on a process pool.
+    The frequent itemsets are sharded by size into chunks of shard_size, every worker computes the metrics of its
+    shard with vectorized lookups into a support table in shared memory and returns its local top k,
+    which are merged into the global top k. Same parameters and result as top_k_rules.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown rule metric: {metric}, expected one of {METRICS}")
+    min_thresholds = min_thresholds or {}
+    for name in min_thresholds:
+        if name not in METRICS:
+            raise ValueError(f"Unknown rule metric: {name}, expected one of {METRICS}")
+    if len(frequent_itemsets) == 0:
+        return pd.DataFrame(columns=RULE_COLUMNS)
+
+    items, tables, size_ranges = build_support_table(frequent_itemsets, rule_itemsets)
+    tasks = []
+    for size, (first, last) in size_ranges.items():
+        for start in range(first, last, shard_size):
+            tasks.append((size, start, min(start + shard_size, last)))
+
+    blocks = []
+    descriptions = {}
+    try:
+        for name, array in tables.items():
+            block, descriptions[name] = to_shared_memory(array)
+            blocks.append(block)
+
+        with ProcessPoolExecutor(max_workers=n_jobs or os.cpu_count(), initializer=attach_shared_tables,
+                                 initargs=(descriptions,)) as executor:
+            futures = [executor.submit(shard_top_k_rules, size, start, stop, len(items) + 1, k, metric,
+                                       min_thresholds)
+                       for size, start, stop in tasks]
+            shard_results = [future.result() for future in futures]
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    if not shard_results:
+        return pd.DataFrame(columns=RULE_COLUMNS)
+    merged = {name: np.concatenate([result[name] for result in shard_results]) for name in shard_results[0]}
+    merged = select_top_k(merged, k, metric)
+    return decode_rules(items, tables, merged, np.argsort(-merged[metric], kind="stable"))
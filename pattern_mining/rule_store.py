@@ -0,0 +1,116 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+def intern_items(frame, set_columns):
+    """
+    Collect the items of all set columns into one sorted dictionary table
+    """
+    items = set()
+    for column in set_columns:
+        for itemset in frame[column]:
+            items.update(itemset)
+    return sorted(items)
+
+
+def encode_sets(sets, item_ids):
+    """
+    Encode a column of itemsets CSR-style: offsets (n + 1) into one flat array of item IDs
+    """
+    lengths = np.fromiter((len(s) for s in sets), dtype=np.int64, count=len(sets))
+    offsets = np.zeros(len(sets) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    ids = np.fromiter((item_ids[item] for s in sets for item in sorted(s)), dtype=np.int32, count=offsets[-1])
+    return offsets, ids
+
+
+def save_pattern_store(frame, path, set_columns, metric_columns):
+    """
+    Save itemsets or rules as a memory-mappable NumPy bundle:
+    items.npy (dictionary table), <column>.offsets.npy + <column>.ids.npy per set column and one
+    float32 <metric>.npy per metric column, described by store.json.
+    """
+    path = Path(path)
+    path.mkdir(exist_ok=True, parents=True)
+
+    items = intern_items(frame, set_columns)
+    item_ids = {item: i for i, item in enumerate(items)}
+    np.save(path / "items.npy", np.array(items, dtype=str))
+
+    for column in set_columns:
+        offsets, ids = encode_sets(list(frame[column]), item_ids)
+        np.save(path / f"{column}.offsets.npy", offsets)
+        np.save(path / f"{column}.ids.npy", ids)
+    for column in metric_columns:
+        np.save(path / f"{column}.npy", frame[column].to_numpy(dtype=np.float32))
+
+    with open(path / "store.json", "w") as f:
+        json.dump({"rows": len(frame), "set_columns": list(set_columns), "metric_columns": list(metric_columns)}, f)
+
+
+def save_rule_store(rules, path):
+    """
+    Save association rules (antecedents, consequents and their metrics) as a pattern store
+    """
+    metric_columns = [c for c in ["antecedent support", "consequent support", "support", "confidence", "lift",
+                                  "leverage", "conviction"] if c in rules.columns]
+    save_pattern_store(rules, path, ["antecedents", "consequents"], metric_columns)
+
+
+def save_itemset_store(itemsets, path):
+    """
+    Save frequent itemsets and their support as a pattern store
+    """
+    save_pattern_store(itemsets, path, ["itemsets"], ["support"])
+
+
+class PatternStore:
+    def __init__(self, path):
+        """
+        Read-only view of a pattern store, all arrays are memory-mapped and only touched when accessed.
+        :param path: The folder of the store.
+        """
+        self.path = Path(path)
+        with open(self.path / "store.json") as f:
+            description = json.load(f)
+        self.n_rows = description["rows"]
+        self.set_columns = description["set_columns"]
+        self.metric_columns = description["metric_columns"]
+        self.items = np.load(self.path / "items.npy", mmap_mode="r")
+        self.offsets = {c: np.load(self.path / f"{c}.offsets.npy", mmap_mode="r") for c in self.set_columns}
+        self.ids = {c: np.load(self.path / f"{c}.ids.npy", mmap_mode="r") for c in self.set_columns}
+        self.metrics = {c: np.load(self.path / f"{c}.npy", mmap_mode="r") for c in self.metric_columns}
+
+    def __len__(self):
+        return self.n_rows
+
+    def item_ids(self, column, row):
+        """
+        Item IDs of the set in the given column and row
+        """
+        offsets = self.offsets[column]
+        return self.ids[column][offsets[row]:offsets[row + 1]]
+
+    def itemset(self, column, row):
+        """
+        Item names of the set in the given column and row
+        """
+        return [str(self.items[i]) for i in self.item_ids(column, row)]
+
+    def to_dataframe(self):
+        """
+        Materialise the store as a DataFrame with frozenset columns like the mining results
+        """
+        frame = {c: [frozenset(self.itemset(c, row)) for row in range(self.n_rows)] for c in self.set_columns}
+        frame.update({c: np.asarray(values) for c, values in self.metrics.items()})
+        return pd.DataFrame(frame)
+
+
+def load_pattern_store(path):
+    """
+    Open a pattern store written by save_pattern_store
+    """
+    return PatternStore(path)
@@ -0,0 +1,161 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+from mlxtend.frequent_patterns import apriori
+
+from bitmap_transactions import BitmapTransactions, item_question
+from format_for_causal_testing import parse_pattern
+from incremental_mining import IncrementalMiner
+from mining_engines import ENGINES, filter_itemsets, mine_frequent_itemsets, question_groups
+from rule_generation import top_k_rules, top_k_rules_parallel
+from rule_store import load_pattern_store, save_itemset_store
+from threshold_sweep import ThresholdSweep
+
+
+def survey_frame(seed=0, n=200):
+    """
+    One-hot answers of a toy survey, the answers depend on a latent trait so larger itemsets are frequent
+    """
+    rng = np.random.default_rng(seed)
+    latent = rng.integers(0, 2, size=n)
+    questions = {"Q1": 3, "Q2": 2, "Q3.1": 2, "Q3.2": 2, "Q4": 3}
+    columns = {}
+    for question, n_answers in questions.items():
+        answer = np.where(rng.random(n) < 0.7, latent, rng.integers(0, n_answers, size=n))
+        for value in range(n_answers):
+            columns[f"{question}_{value + 1}"] = answer == value
+    return pd.DataFrame(columns)
+
+
+def as_dict(frequent_itemsets):
+    return dict(zip(frequent_itemsets["itemsets"], frequent_itemsets["support"]))
+
+
+def assert_same_itemsets(result, expected):
+    result, expected = as_dict(result), as_dict(expected)
+    assert set(result) == set(expected)
+    assert all(np.isclose(result[itemset], expected[itemset]) for itemset in expected)
+
+
+def spans_one_question(itemset):
+    questions = [item_question(item) for item in itemset]
+    return len(set(questions)) == len(questions)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_engines_match_mlxtend(engine):
+    data = survey_frame()
+    transactions = BitmapTransactions.from_dataframe(data)
+    result = mine_frequent_itemsets(transactions, min_support=0.1, max_len=3, engine=engine)
+    assert_same_itemsets(result, apriori(data, min_support=0.1, max_len=3, use_colnames=True))
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_engines_never_combine_items_of_one_question(engine):
+    data = survey_frame()
+    transactions = BitmapTransactions.from_dataframe(data)
+    result = mine_frequent_itemsets(transactions, min_support=0.1, max_len=3, engine=engine,
+                                    item_groups=question_groups(transactions))
+    assert all(spans_one_question(itemset) for itemset in result["itemsets"])
+    # sub-questions (Q3.1, Q3.2) belong to the same question
+    assert not any({"Q3.1_1", "Q3.2_1"} <= itemset for itemset in result["itemsets"])
+
+    expected = apriori(data, min_support=0.1, max_len=3, use_colnames=True)
+    expected = expected[expected["itemsets"].map(spans_one_question)]
+    assert_same_itemsets(result, expected)
+
+
+@pytest.mark.parametrize("itemset_type", ["closed", "maximal"])
+def test_filter_itemsets(itemset_type):
+    frequent_itemsets = apriori(survey_frame(), min_support=0.1, use_colnames=True)
+    supports = as_dict(frequent_itemsets)
+    if itemset_type == "closed":
+        expected = {itemset for itemset, support in supports.items()
+                    if not any(itemset < other and np.isclose(support, supports[other]) for other in supports)}
+    else:
+        expected = {itemset for itemset in supports if not any(itemset < other for other in supports)}
+    assert set(filter_itemsets(frequent_itemsets, itemset_type)["itemsets"]) == expected
+
+
+def rule_set(rules):
+    return {(antecedent, consequent): lift for antecedent, consequent, lift
+            in zip(rules["antecedents"], rules["consequents"], rules["lift"])}
+
+
+def test_top_k_rules_parallel_matches_serial():
+    frequent_itemsets = apriori(survey_frame(), min_support=0.1, max_len=3, use_colnames=True)
+    serial = top_k_rules(frequent_itemsets, k=50, min_thresholds={"confidence": 0.5})
+    parallel = top_k_rules_parallel(frequent_itemsets, k=50, min_thresholds={"confidence": 0.5}, n_jobs=2)
+    assert len(serial) == len(parallel) == 50
+    assert np.allclose(serial["lift"], parallel["lift"])
+    # the 50th lift may be tied, compare the rules above it
+    cut = serial["lift"].iloc[-1]
+    assert {rule for rule, lift in rule_set(serial).items() if lift > cut} == \
+           {rule for rule, lift in rule_set(parallel).items() if lift > cut}
+
+
+def test_top_k_rules_parallel_with_keys_beyond_int64():
+    # 700 items and itemsets of 7 items do not fit the int64 itemset keys
+    rng = np.random.default_rng(0)
+    items = [f"Q{i}_1" for i in range(700)]
+    itemset = sorted(rng.choice(items, 7, replace=False))
+    supports = {frozenset([item]): 0.5 for item in items}
+    for size in range(1, 8):
+        for subset in itertools.combinations(itemset, size):
+            supports[frozenset(subset)] = rng.uniform(0.05, 0.1) / size
+    frequent_itemsets = pd.DataFrame({"support": list(supports.values()), "itemsets": list(supports.keys())})
+    serial = top_k_rules(frequent_itemsets, k=20)
+    parallel = top_k_rules_parallel(frequent_itemsets, k=20, n_jobs=1)
+    assert rule_set(serial).keys() == rule_set(parallel).keys()
+
+
+def test_threshold_sweep_matches_direct_mining():
+    transactions = BitmapTransactions.from_dataframe(survey_frame())
+    sweep = ThresholdSweep(transactions, [0.1, 0.2])
+    assert_same_itemsets(sweep.itemsets(0.2), mine_frequent_itemsets(transactions, min_support=0.2, engine="eclat"))
+    rules = sweep.association_rules(0.2, 0.6)
+    assert len(rules) > 0
+    assert (rules["support"] >= 0.2).all() and (rules["confidence"] >= 0.6).all()
+    with pytest.raises(ValueError):
+        sweep.itemsets(0.05)
+
+
+def full_mining(transactions):
+    return mine_frequent_itemsets(transactions, min_support=0.1, max_len=3, engine="eclat",
+                                  item_groups=question_groups(transactions))
+
+
+def test_incremental_update_after_append_matches_full_mining(tmp_path):
+    transactions = BitmapTransactions.from_dataframe(survey_frame())
+    miner = IncrementalMiner(tmp_path, min_support=0.1, max_len=3)
+    assert_same_itemsets(miner.update(transactions.slice_transactions(0, 150)),
+                         full_mining(transactions.slice_transactions(0, 150)))
+    assert_same_itemsets(miner.update(transactions), full_mining(transactions))
+
+
+def test_incremental_update_after_question_change_matches_full_mining(tmp_path):
+    data = survey_frame()
+    miner = IncrementalMiner(tmp_path, min_support=0.1, max_len=3)
+    miner.update(BitmapTransactions.from_dataframe(data))
+    # new answers to Q4
+    changed = data.copy()
+    answer = np.random.default_rng(1).integers(0, 3, size=len(data))
+    for value in range(3):
+        changed[f"Q4_{value + 1}"] = answer == value
+    transactions = BitmapTransactions.from_dataframe(changed)
+    assert_same_itemsets(miner.update(transactions), full_mining(transactions))
+
+
+def test_itemset_store_round_trip(tmp_path):
+    frequent_itemsets = apriori(survey_frame(), min_support=0.1, max_len=3, use_colnames=True)
+    save_itemset_store(frequent_itemsets, tmp_path / "frequent_itemsets")
+    stored = load_pattern_store(tmp_path / "frequent_itemsets").to_dataframe()
+    assert list(stored["itemsets"]) == list(frequent_itemsets["itemsets"])
+    assert np.allclose(stored["support"], frequent_itemsets["support"])
+
+
+def test_parse_pattern_keeps_sub_question_items():
+    assert parse_pattern(["Q20.1_3", "Q91_Alter"]) == [(20, "3"), (91, "Alter")]
+    assert parse_pattern("frozenset({'Q20.1_3', 'Q5_Ja'})") == [(20, "3"), (5, "Ja")]
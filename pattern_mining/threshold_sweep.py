@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+from mining_engines import mine_frequent_itemsets
+from rule_generation import RULE_COLUMNS, build_support_table, decode_rules, itemset_rule_metrics
+
+
+class ThresholdSweep:
+    def __init__(self, transactions, min_supports, max_len=3, engine="eclat", item_groups=None):
+        """
+        Mines the frequent itemset lattice once at the lowest min_support and answers every higher
+        min_support / min_confidence combination by filtering the lattice and its rules in memory.
+        :param transactions: The BitmapTransactions to mine.
+        :param min_supports: The minimum supports that will be asked for, the lowest one is mined.
+        :param max_len: The maximum itemset length.
+        :param engine: The mining engine, see mining_engines.ENGINES.
+        :param item_groups: Optional group per item, items of one group are never combined.
+        """
+        self.min_support = min(min_supports)
+        print(f"Mining the itemset lattice at the lowest minimum support {self.min_support*100}%...")
+        self.frequent_itemsets = mine_frequent_itemsets(transactions, min_support=self.min_support,
+                                                        max_len=max_len, engine=engine, item_groups=item_groups)
+        self.itemset_supports = self.frequent_itemsets["support"].to_numpy()
+
+        # all rules of the lattice, as arrays sorted by support for fast filtering
+        self.rules = None
+        if len(self.frequent_itemsets) > 0:
+            self.items, self.tables, size_ranges = build_support_table(self.frequent_itemsets)
+            parts = [itemset_rule_metrics(self.tables, self.tables["rows_by_size"][first:last], size,
+                                          len(self.items) + 1)
+                     for size, (first, last) in size_ranges.items()]
+            if parts:
+                rules = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+                order = np.argsort(rules["support"], kind="stable")
+                self.rules = {name: values[order] for name, values in rules.items()}
+        n_rules = 0 if self.rules is None else len(self.rules["support"])
+        print(f"Lattice has {len(self.frequent_itemsets)} itemsets and {n_rules} rules")
+
+    def check_support(self, min_support):
+        if min_support < self.min_support:
+            raise ValueError(f"The lattice was mined at {self.min_support}, cannot answer min_support {min_support}")
+
+    def itemsets(self, min_support):
+        """
+        Frequent itemsets at min_support
+        """
+        self.check_support(min_support)
+        return self.frequent_itemsets[self.itemset_supports >= min_support].reset_index(drop=True)
+
+    def rule_indices(self, min_support, min_confidence):
+        self.check_support(min_support)
+        if self.rules is None:
+            return np.empty(0, dtype=np.int64)
+        first = np.searchsorted(self.rules["support"], min_support)
+        return first + np.flatnonzero(self.rules["confidence"][first:] >= min_confidence)
+
+    def association_rules(self, min_support, min_confidence, metric="lift"):
+        """
+        Association rules at min_support and min_confidence, sorted by the metric
+        """
+        indices = self.rule_indices(min_support, min_confidence)
+        if len(indices) == 0:
+            return pd.DataFrame(columns=RULE_COLUMNS)
+        ranking = indices[np.argsort(-self.rules[metric][indices], kind="stable")]
+        return decode_rules(self.items, self.tables, self.rules, ranking)
+
+    def grid(self, min_supports, min_confidences):
+        """
+        Number of frequent itemsets and association rules for every min_support x min_confidence grid point
+        """
+        sorted_supports = np.sort(self.itemset_supports)
+        rows = []
+        for min_support in sorted(min_supports):
+            self.check_support(min_support)
+            n_itemsets = len(sorted_supports) - np.searchsorted(sorted_supports, min_support)
+            confidences = np.empty(0)
+            if self.rules is not None:
+                first = np.searchsorted(self.rules["support"], min_support)
+                confidences = np.sort(self.rules["confidence"][first:])
+            for min_confidence in sorted(min_confidences):
+                n_rules = len(confidences) - np.searchsorted(confidences, min_confidence)
+                rows.append([min_support, min_confidence, int(n_itemsets), int(n_rules)])
+        return pd.DataFrame(rows, columns=["min_support", "min_confidence", "itemsets", "rules"])
+
+
+def threshold_sweep(transactions, min_supports, min_confidences, max_len=3, engine="eclat", item_groups=None):
+    """
+    Mine once at the lowest min_support and report the itemset and rule counts per
+    min_support / min_confidence combination as a table
+    """
+    sweep = ThresholdSweep(transactions, min_supports, max_len=max_len, engine=engine, item_groups=item_groups)
+    return sweep.grid(min_supports, min_confidences)